@@ -20,6 +20,10 @@ setup(
         "smg-rigging",
         "smg-utility"
     ],
+    extras_require={
+        "accelerate": ["PyOpenGL-accelerate"],
+        "numba": ["numba"]
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
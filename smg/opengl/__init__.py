@@ -1,11 +1,28 @@
+# If requested (by setting the SMG_OPENGL_FAST_MODE environment variable to 1), configure PyOpenGL for speed rather
+# than safety. Turning off the per-call error checking, logging and array size checking makes each wrapped GL call
+# substantially cheaper, but means that OpenGL errors will no longer be detected (or raised as exceptions). Note that
+# these flags are process-wide, and only take effect if they're set before OpenGL.GL is first imported, so this has
+# no effect if any other module has already imported OpenGL.GL by the time this package is imported.
+import os
+
+if os.environ.get("SMG_OPENGL_FAST_MODE") == "1":
+    import OpenGL
+
+    OpenGL.ERROR_CHECKING = False
+    OpenGL.ERROR_LOGGING = False
+    OpenGL.ARRAY_SIZE_CHECKING = False
+    OpenGL.STORE_POINTERS = False
+
 from .camera_renderer import CameraRenderer
 from .opengl_depth_testing_context import OpenGLDepthTestingContext
 from .opengl_framebuffer import OpenGLFrameBuffer
+from .opengl_image_reader import OpenGLImageReader
 from .opengl_image_renderer import OpenGLImageRenderer
 from .opengl_lighting_context import OpenGLLightingContext
 from .opengl_matrix_context import OpenGLMatrixContext
 from .opengl_texture import OpenGLTexture
 from .opengl_texture_context import OpenGLTextureContext
+from .opengl_timer_context import OpenGLTimerContext
 from .opengl_trimesh import OpenGLTriMesh
 from .opengl_util import OpenGLUtil
 from .scene_renderer import SceneRenderer
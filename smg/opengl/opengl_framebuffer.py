@@ -1,51 +1,64 @@
 from OpenGL.GL import *
 from OpenGL.GL.framebufferobjects import *
+from typing import Dict, Tuple
 
 
 class OpenGLFrameBuffer:
     """An off-screen frame buffer to which OpenGL rendering calls can be directed."""
 
+    # CONSTANTS
+
+    # The pixel formats and types to use when allocating storage for buffers with different internal formats via
+    # glTexImage2D (needed when glTexStorage2D isn't available).
+    __PIXEL_FORMATS = {
+        GL_DEPTH_COMPONENT24: (GL_DEPTH_COMPONENT, GL_UNSIGNED_INT),
+        GL_RGBA8: (GL_RGBA, GL_UNSIGNED_BYTE)
+    }  # type: Dict[int, Tuple[int, int]]
+
     # CONSTRUCTOR
 
-    def __init__(self, width: int, height: int):
+    def __init__(self, width: int, height: int, *, bind_on_construct: bool = False):
         """
         Construct a frame buffer with the specified dimensions.
 
-        :param width:   The width of the frame buffer.
-        :param height:  The height of the frame buffer.
+        .. note::
+            By default, whichever frame buffer was bound before construction will be bound again afterwards. If the
+            caller is going to render to the new frame buffer straight away, it can instead ask for the new frame
+            buffer to be left bound, avoiding a pointless unbind and rebind.
+
+        :param width:               The width of the frame buffer.
+        :param height:              The height of the frame buffer.
+        :param bind_on_construct:   Whether to leave the new frame buffer bound after construction.
         """
         self.__alive = False    # type: bool
         self.__height = height  # type: int
         self.__width = width    # type: int
 
-        # Set up the colour buffer.
-        self.__colour_buffer_id = glGenTextures(1)  # type: int
-        glBindTexture(GL_TEXTURE_2D, self.__colour_buffer_id)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-
-        # Set up the depth buffer.
-        self.__depth_buffer_id = glGenRenderbuffers(1)  # type: int
-        glBindRenderbuffer(GL_RENDERBUFFER, self.__depth_buffer_id)
-        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
-
-        # Set up the frame buffer.
+        # Set up the colour and depth buffers. Both are textures, which allows the depth buffer to be sampled later
+        # if desired. Where possible, they're given immutable storage, which allows the driver to choose their
+        # layouts up-front.
+        self.__colour_buffer_id = OpenGLFrameBuffer.__make_buffer(
+            GL_RGBA8, GL_LINEAR, width, height
+        )  # type: int
+        self.__depth_buffer_id = OpenGLFrameBuffer.__make_buffer(
+            GL_DEPTH_COMPONENT24, GL_NEAREST, width, height
+        )  # type: int
+
+        # Set up the frame buffer, remembering which frame buffer was previously bound so that it can be restored.
+        previous_id = int(glGetIntegerv(GL_FRAMEBUFFER_BINDING))  # type: int
         self.__id = glGenFramebuffers(1)  # type: int
         glBindFramebuffer(GL_FRAMEBUFFER, self.__id)
 
-        # Attach the colour buffer to the frame buffer.
-        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.__colour_buffer_id, 0)
-
-        # Attach the depth buffer to the frame buffer.
-        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.__depth_buffer_id)
+        # Attach the colour and depth buffers to the frame buffer.
+        self.__attach_buffers()
 
         # Check that the frame buffer has been successfully set up.
         if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
             raise RuntimeError("Error: Failed to create the frame buffer")
 
-        # Switch back to rendering to the normal display.
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        # Unless we've been asked to leave the new frame buffer bound, switch back to the previous frame buffer.
+        if not bind_on_construct:
+            glBindFramebuffer(GL_FRAMEBUFFER, previous_id)
 
         # Mark construction of the frame buffer as having finished successfully.
         self.__alive = True
@@ -73,6 +86,28 @@ class OpenGLFrameBuffer:
 
     # PROPERTIES
 
+    @property
+    def colour_buffer_id(self) -> int:
+        """
+        Get the ID of the texture that serves as the frame buffer's colour buffer.
+
+        .. note::
+            This can be used to consume what has been rendered without reading it back from the GPU, e.g. by
+            sampling from it in a later pass, or by registering it with CUDA (cudaGraphicsGLRegisterImage).
+
+        :return:    The ID of the texture that serves as the frame buffer's colour buffer.
+        """
+        return self.__colour_buffer_id
+
+    @property
+    def depth_buffer_id(self) -> int:
+        """
+        Get the ID of the texture that serves as the frame buffer's depth buffer.
+
+        :return:    The ID of the texture that serves as the frame buffer's depth buffer.
+        """
+        return self.__depth_buffer_id
+
     @property
     def height(self) -> int:
         """
@@ -93,20 +128,99 @@ class OpenGLFrameBuffer:
 
     # PUBLIC METHODS
 
+    def resize(self, width: int, height: int) -> None:
+        """
+        Resize the frame buffer.
+
+        .. note::
+            Since the storage of the colour and depth buffers may be immutable, this makes new buffers of the right
+            size and attaches them to the existing frame buffer, rather than setting up a whole new frame buffer.
+
+        :param width:   The new width of the frame buffer.
+        :param height:  The new height of the frame buffer.
+        """
+        if width == self.__width and height == self.__height:
+            return
+
+        old_buffer_ids = [self.__colour_buffer_id, self.__depth_buffer_id]
+        self.__colour_buffer_id = OpenGLFrameBuffer.__make_buffer(GL_RGBA8, GL_LINEAR, width, height)
+        self.__depth_buffer_id = OpenGLFrameBuffer.__make_buffer(GL_DEPTH_COMPONENT24, GL_NEAREST, width, height)
+
+        # Attach the new buffers to the frame buffer, remembering which frame buffer was previously bound so that
+        # it can be restored afterwards.
+        previous_id = int(glGetIntegerv(GL_FRAMEBUFFER_BINDING))  # type: int
+        glBindFramebuffer(GL_FRAMEBUFFER, self.__id)
+        self.__attach_buffers()
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)  # type: int
+        glBindFramebuffer(GL_FRAMEBUFFER, previous_id)
+
+        try:
+            glDeleteTextures(old_buffer_ids)
+        except Error:
+            # Note: As in terminate, failing to delete the old buffers is much less harmful than crashing.
+            pass
+
+        self.__width = width
+        self.__height = height
+
+        # Check that the frame buffer is still complete now that the new buffers have been attached.
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Error: Failed to resize the frame buffer")
+
     def terminate(self) -> None:
         """Destroy the frame buffer."""
         if self.__alive:
             try:
-                glDeleteRenderbuffers(1, [self.__depth_buffer_id])
-                glDeleteTextures([self.__colour_buffer_id])
+                glDeleteTextures([self.__colour_buffer_id, self.__depth_buffer_id])
                 glDeleteFramebuffers(1, [self.__id])
             except Error:
-                # FIXME: Unfortunately, glDeleteRenderbuffers seems to be in different places in the different
-                #        versions of PyOpenGL we use. That sometimes causes us not to find it, and an exception
+                # FIXME: Unfortunately, the frame buffer functions seem to be in different places in the different
+                #        versions of PyOpenGL we use. That sometimes causes us not to find them, and an exception
                 #        to be raised. That leaves us in a much worse position than we would have been had we
-                #        simply not tried to be tidy and call glDeleteRenderbuffers in the first place. Since
-                #        we're good people, we do still try to call it, but we also suppress any exception that
-                #        gets raised as a defence mechanism. That seems like a fair compromise position.
+                #        simply not tried to be tidy and delete the frame buffer in the first place. Since we're
+                #        good people, we do still try to delete it, but we also suppress any exception that gets
+                #        raised as a defence mechanism. That seems like a fair compromise position.
                 pass
 
             self.__alive = False
+
+    # PRIVATE METHODS
+
+    def __attach_buffers(self) -> None:
+        """
+        Attach the colour and depth buffers to the frame buffer.
+
+        .. note::
+            The frame buffer must be bound prior to calling this method.
+        """
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.__colour_buffer_id, 0)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_TEXTURE_2D, self.__depth_buffer_id, 0)
+
+    # PRIVATE STATIC METHODS
+
+    @staticmethod
+    def __make_buffer(internal_format: int, filter_mode: int, width: int, height: int) -> int:
+        """
+        Make a texture that can be used as one of the buffers of a frame buffer.
+
+        .. note::
+            The texture is given immutable storage via glTexStorage2D where this is available (OpenGL 4.2+ or
+            ARB_texture_storage), and falls back to allocating its storage via glTexImage2D otherwise.
+
+        :param internal_format: The internal format of the texture (e.g. GL_RGBA8).
+        :param filter_mode:     The filter mode to use when sampling from the texture (e.g. GL_LINEAR).
+        :param width:           The width of the texture.
+        :param height:          The height of the texture.
+        :return:                The ID of the texture.
+        """
+        texture_id = glGenTextures(1)  # type: int
+        glBindTexture(GL_TEXTURE_2D, texture_id)
+        if bool(glTexStorage2D):
+            glTexStorage2D(GL_TEXTURE_2D, 1, internal_format, width, height)
+        else:
+            pixel_format, pixel_type = OpenGLFrameBuffer.__PIXEL_FORMATS[internal_format]
+            glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, pixel_format, pixel_type, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, filter_mode)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, filter_mode)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        return texture_id
@@ -0,0 +1,197 @@
+import ctypes
+import numpy as np
+
+from OpenGL.GL import *
+from typing import Dict, List, Optional, Tuple
+
+from .opengl_util import OpenGLUtil
+
+
+class OpenGLImageReader:
+    """
+    Used to read images back from the active frame buffer asynchronously, via rings of pixel buffer objects (PBOs).
+
+    .. note::
+        Each read starts an asynchronous transfer of the current contents of the frame buffer into the next PBO in
+        the ring, and returns the contents of the oldest PBO in the ring (blocking only if that transfer hasn't yet
+        finished). Once the ring is full, the images returned therefore lag ring_size - 1 reads behind the reads
+        that are issued. Until then, the image from the first read is returned, since that's the only one that
+        could be available.
+    .. note::
+        Each transfer is followed by a fence, which is polled (without waiting) before the PBO is mapped. If the
+        transfer into the oldest PBO hasn't finished yet, the most recent image that was available is returned
+        again instead, so a read only ever blocks if no image has been available yet. Each image returned is a
+        fresh, C-contiguous array, so callers are free to keep or modify it.
+    .. note::
+        Unlike OpenGLUtil.read_bgr_image and OpenGLUtil.read_depth_image, this avoids stalling the CPU whilst the
+        GPU finishes rendering and transfers the image, which makes it a much better fit for capture loops that can
+        tolerate a small amount of latency.
+    """
+
+    # CONSTRUCTOR
+
+    def __init__(self, *, ring_size: int = 2):
+        """
+        Construct an OpenGL image reader.
+
+        :param ring_size:   The number of pixel buffer objects to cycle through for each type of image.
+        """
+        self.__alive = True           # type: bool
+        self.__fences = {}            # type: Dict[Tuple[int, int], List[Optional[int]]]
+        self.__issued = {}            # type: Dict[Tuple[int, int], int]
+        self.__latest = {}            # type: Dict[Tuple[int, int], np.ndarray]
+        self.__pbo_ids = {}           # type: Dict[Tuple[int, int], List[int]]
+        self.__pbo_size = {}          # type: Dict[Tuple[int, int], int]
+        self.__ring_size = ring_size  # type: int
+
+    # DESTRUCTOR
+
+    def __del__(self):
+        """Destroy the image reader."""
+        self.terminate()
+
+    # SPECIAL METHODS
+
+    def __enter__(self):
+        """No-op (needed to allow the reader's lifetime to be managed by a with statement)."""
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        """Destroy the reader at the end of the with statement that's used to manage its lifetime."""
+        self.terminate()
+
+    # PUBLIC METHODS
+
+    def read_bgr_image(self, width: int, height: int) -> np.ndarray:
+        """
+        Start reading the contents of the screen (or active frame-buffer) into a BGR image, and return the oldest
+        BGR image whose reading was started earlier.
+
+        :param width:   The screen / frame-buffer width.
+        :param height:  The screen / frame-buffer height.
+        :return:        The oldest BGR image in the ring.
+        """
+        # Note: The flipped image is copied into a C-contiguous array (as in OpenGLUtil.read_bgr_image), both so that
+        #       it can be handed straight to C code (e.g. OpenCV), and so that it doesn't share memory with the data
+        #       that may be returned again by the next read.
+        data = self.__read(width, height, GL_BGR, GL_UNSIGNED_BYTE, 3)  # type: np.ndarray
+        return np.ascontiguousarray(data.reshape((height, width, 3))[::-1, :])
+
+    def read_depth_image(self, width: int, height: int, near_val: float = 0.1, far_val: float = 1000.0) \
+            -> np.ndarray:
+        """
+        Start reading the contents of the active depth buffer into a floating-point depth image, and return the
+        oldest depth image whose reading was started earlier.
+
+        :param width:       The depth buffer width.
+        :param height:      The depth buffer height.
+        :param near_val:    The distance to the camera frustum's near plane.
+        :param far_val:     The distance to the camera frustum's far plane.
+        :return:            The oldest depth image in the ring.
+        """
+        data = self.__read(width, height, GL_DEPTH_COMPONENT, GL_FLOAT, 4)  # type: np.ndarray
+        depth_image = data.view(np.float32).reshape((height, width))[::-1, :]  # type: np.ndarray
+        return OpenGLUtil.linearise_depth_image(depth_image, near_val, far_val)
+
+    def terminate(self) -> None:
+        """Destroy the image reader."""
+        if self.__alive:
+            for fences in self.__fences.values():
+                self.__delete_fences(fences)
+
+            for pbo_ids in self.__pbo_ids.values():
+                try:
+                    glDeleteBuffers(len(pbo_ids), pbo_ids)
+                except Error:
+                    # Note: As with the textures, failing to delete the buffers is fairly harmless, whereas
+                    #       crashing isn't.
+                    pass
+
+            self.__alive = False
+
+    # PRIVATE METHODS
+
+    def __read(self, width: int, height: int, pixel_format: int, pixel_type: int, bytes_per_pixel: int) \
+            -> np.ndarray:
+        """
+        Start reading the contents of the active frame buffer into the next PBO in the appropriate ring, and return
+        the contents of the oldest PBO in that ring.
+
+        :param width:           The frame buffer width.
+        :param height:          The frame buffer height.
+        :param pixel_format:    The format of the pixel data to read (e.g. GL_BGR).
+        :param pixel_type:      The type of the pixel data to read (e.g. GL_UNSIGNED_BYTE).
+        :param bytes_per_pixel: The number of bytes per pixel for the specified format and type.
+        :return:                A byte array containing a copy of the contents of the oldest PBO in the ring.
+        """
+        key = (pixel_format, pixel_type)         # type: Tuple[int, int]
+        size = width * height * bytes_per_pixel  # type: int
+
+        # Make sure that the ring exists, and that its PBOs are the right size. If they need to be (re)allocated,
+        # any reads that were in flight are discarded.
+        if key not in self.__pbo_ids:
+            self.__pbo_ids[key] = [int(i) for i in np.atleast_1d(glGenBuffers(self.__ring_size))]
+            self.__fences[key] = [None] * self.__ring_size
+            self.__pbo_size[key] = 0
+
+        pbo_ids = self.__pbo_ids[key]  # type: List[int]
+        fences = self.__fences[key]    # type: List[Optional[int]]
+        if self.__pbo_size[key] != size:
+            for pbo_id in pbo_ids:
+                glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo_id)
+                glBufferData(GL_PIXEL_PACK_BUFFER, size, None, GL_STREAM_READ)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            self.__delete_fences(fences)
+            self.__issued[key] = 0
+            self.__latest.pop(key, None)
+            self.__pbo_size[key] = size
+
+        # Start reading the contents of the frame buffer into the next PBO in the ring.
+        issued = self.__issued[key]      # type: int
+        idx = issued % self.__ring_size  # type: int
+
+        glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo_ids[idx])
+        glReadPixels(0, 0, width, height, pixel_format, pixel_type, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        glPopClientAttrib()
+
+        # Insert a fence after the transfer, so that we can later tell whether it has finished. (If the PBO still
+        # had a fence from an earlier transfer whose result was never collected, that fence is no longer needed.)
+        if fences[idx] is not None:
+            glDeleteSync(fences[idx])
+        fences[idx] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+        issued += 1
+        self.__issued[key] = issued
+
+        # If the transfer into the oldest PBO in the ring (until the ring has filled up, the first one) has finished,
+        # or if there's no earlier image to return instead, collect its contents. Then return the latest image.
+        oldest_idx = issued % self.__ring_size if issued >= self.__ring_size else 0  # type: int
+        fence = fences[oldest_idx]  # type: Optional[int]
+        if fence is not None:
+            status = glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0)  # type: int
+            if status in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED) or key not in self.__latest:
+                glDeleteSync(fence)
+                fences[oldest_idx] = None
+                self.__latest[key] = OpenGLUtil.read_buffer(GL_PIXEL_PACK_BUFFER, pbo_ids[oldest_idx], size)
+
+        return self.__latest[key]
+
+    # PRIVATE STATIC METHODS
+
+    @staticmethod
+    def __delete_fences(fences: List[Optional[int]]) -> None:
+        """
+        Delete any fences in the specified list, and reset the corresponding list entries to None.
+
+        :param fences:  The list of fences.
+        """
+        for i, fence in enumerate(fences):
+            if fence is not None:
+                try:
+                    glDeleteSync(fence)
+                except Error:
+                    pass
+                fences[i] = None
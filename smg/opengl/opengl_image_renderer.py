@@ -1,6 +1,9 @@
+import ctypes
 import numpy as np
 
 from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_1_5 import glBufferData as raw_glBufferData
+from typing import List, Optional, Tuple
 
 from .opengl_texture import OpenGLTexture
 from .opengl_texture_context import OpenGLTextureContext
@@ -12,10 +15,18 @@ class OpenGLImageRenderer:
 
     # CONSTRUCTOR
 
-    def __init__(self):
-        """Construct an OpenGL image renderer."""
-        self.__alive = True               # type: bool
-        self.__texture = OpenGLTexture()  # type: OpenGLTexture
+    def __init__(self, *, pbo_count: int = 2):
+        """
+        Construct an OpenGL image renderer.
+
+        :param pbo_count:   The number of pixel buffer objects to cycle through when uploading images to the GPU.
+        """
+        self.__alive = True                                                          # type: bool
+        self.__image_shape = None                                                    # type: Optional[Tuple[int, ...]]
+        self.__pbo_ids = [int(i) for i in np.atleast_1d(glGenBuffers(pbo_count))]  # type: List[int]
+        self.__pbo_idx = 0                                                           # type: int
+        self.__read_framebuffer_id = None                                            # type: Optional[int]
+        self.__texture = OpenGLTexture()                                             # type: OpenGLTexture
 
     # DESTRUCTOR
 
@@ -35,6 +46,49 @@ class OpenGLImageRenderer:
 
     # PUBLIC METHODS
 
+    def blit_texture(self, texture_id: int, width: int, height: int, *,
+                     dst_rect: Optional[Tuple[int, int, int, int]] = None) -> None:
+        """
+        Copy the contents of a texture that's already on the GPU into the current draw frame buffer.
+
+        .. note::
+            This is much cheaper than render_image, since it's a straight copy on the GPU that doesn't need to go
+            through the rendering pipeline. It's intended for displaying textures that have been rendered on the
+            GPU (e.g. the colour buffer of a SceneRenderer's frame buffer), rather than images on the CPU.
+        .. note::
+            Unlike render_image, this doesn't flip the texture vertically, since textures that have been rendered
+            by OpenGL are already stored bottom-up.
+
+        :param texture_id:  The ID of the texture.
+        :param width:       The width of the texture.
+        :param height:      The height of the texture.
+        :param dst_rect:    The (x0, y0, x1, y1) rectangle, in window coordinates, into which to copy the texture
+                            (if None, the texture will be copied into the current viewport).
+        """
+        if dst_rect is None:
+            x, y, w, h = glGetIntegerv(GL_VIEWPORT)
+            dst_rect = (x, y, x + w, y + h)
+
+        # Make sure the scratch frame buffer from which we read the texture has been constructed.
+        if self.__read_framebuffer_id is None:
+            self.__read_framebuffer_id = int(glGenFramebuffers(1))
+
+        # Attach the texture to the scratch frame buffer, and copy its contents into the current draw frame buffer.
+        # Since blits are affected by the scissor test, we temporarily disable it so that the whole texture gets
+        # copied. Once the copy has been made, we detach the texture again, so that the scratch frame buffer isn't
+        # left referring to a texture that the caller might later delete.
+        previous_read_framebuffer_id = int(glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING))  # type: int
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.__read_framebuffer_id)
+        glFramebufferTexture2D(GL_READ_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, texture_id, 0)
+
+        glPushAttrib(GL_SCISSOR_BIT)
+        glDisable(GL_SCISSOR_TEST)
+        glBlitFramebuffer(0, 0, width, height, *dst_rect, GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        glPopAttrib()
+
+        glFramebufferTexture2D(GL_READ_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, 0, 0)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, previous_read_framebuffer_id)
+
     def render_image(self, image: np.ndarray, *, use_alpha_blending: bool = False) -> None:
         """
         Render a colour image over the contents of the current viewport.
@@ -42,6 +96,11 @@ class OpenGLImageRenderer:
         :param image:               The colour image.
         :param use_alpha_blending:  Whether or not to use alpha blending.
         """
+        # Make sure the image is a C-contiguous array of bytes, so that it can be handed straight to OpenGL
+        # without PyOpenGL needing to silently copy it. In the common case, this is a no-op.
+        if image.dtype != np.uint8 or not image.flags["C_CONTIGUOUS"]:
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+
         channels = image.shape[2]  # type: int
         if use_alpha_blending and channels == 4:
             # Save the current state.
@@ -55,20 +114,16 @@ class OpenGLImageRenderer:
         OpenGLUtil.begin_2d()
 
         with OpenGLTextureContext(self.__texture):
-            self.__texture.set_image(image)
+            # If the image has the same shape as the last one we rendered, reuse the existing texture storage
+            # rather than reallocating it. Otherwise, (re)allocate the storage and remember the new shape.
+            if image.shape == self.__image_shape:
+                self.__upload_image_via_pbo(image)
+            else:
+                self.__texture.set_image(image)
+                self.__image_shape = image.shape
 
             glColor3f(1.0, 1.0, 1.0)
-
-            glBegin(GL_QUADS)
-            glTexCoord2f(0, 0)
-            glVertex2f(0, 0)
-            glTexCoord2f(1, 0)
-            glVertex2f(1, 0)
-            glTexCoord2f(1, 1)
-            glVertex2f(1, 1)
-            glTexCoord2f(0, 1)
-            glVertex2f(0, 1)
-            glEnd()
+            OpenGLUtil.render_textured_quad()
 
         OpenGLUtil.end_2d()
 
@@ -79,5 +134,44 @@ class OpenGLImageRenderer:
     def terminate(self) -> None:
         """Destroy the renderer."""
         if self.__alive:
+            try:
+                glDeleteBuffers(len(self.__pbo_ids), self.__pbo_ids)
+            except Error:
+                # Note: As with the texture, failing to delete the buffers is fairly harmless, whereas crashing isn't.
+                pass
+
+            if self.__read_framebuffer_id is not None:
+                try:
+                    glDeleteFramebuffers(1, [self.__read_framebuffer_id])
+                except Error:
+                    pass
+
             self.__texture.terminate()
             self.__alive = False
+
+    # PRIVATE METHODS
+
+    def __upload_image_via_pbo(self, image: np.ndarray) -> None:
+        """
+        Asynchronously upload an image to the texture via the next pixel buffer object (PBO) in the ring.
+
+        .. note::
+            The texture must be bound prior to calling this method.
+        .. note::
+            The image must be a C-contiguous array of bytes, with the same shape as the one most recently used
+            to (re)allocate the texture storage.
+
+        :param image:   The image to upload.
+        """
+        pbo_id = self.__pbo_ids[self.__pbo_idx]  # type: int
+        self.__pbo_idx = (self.__pbo_idx + 1) % len(self.__pbo_ids)
+
+        # Copy the image into the PBO. Specifying the data in glBufferData orphans any storage that the GPU may
+        # still be reading from for an earlier frame, so the copy doesn't have to wait for that read to finish.
+        # Note that since we already have a raw pointer to the image data, we can bypass PyOpenGL's wrapper.
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pbo_id)
+        raw_glBufferData(GL_PIXEL_UNPACK_BUFFER, image.nbytes, image.ctypes.data_as(ctypes.c_void_p), GL_STREAM_DRAW)
+
+        # Transfer the contents of the PBO to the texture. This can happen asynchronously via DMA.
+        self.__texture.update_image(image, from_unpack_buffer=True)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
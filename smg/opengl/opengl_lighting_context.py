@@ -2,7 +2,7 @@ import numpy as np
 
 from abc import ABC, abstractmethod
 from OpenGL.GL import *
-from typing import Dict, Optional
+from typing import Dict, Tuple
 
 
 class OpenGLLightingContext:
@@ -27,6 +27,10 @@ class OpenGLLightingContext:
     class DirectionalLight(Light):
         """A directional OpenGL light."""
 
+        # CONSTANTS
+
+        __WHITE = np.array([1.0, 1.0, 1.0, 1.0], dtype=np.float32)  # type: np.ndarray
+
         # CONSTRUCTOR
 
         def __init__(self, direction: np.ndarray):
@@ -41,6 +45,9 @@ class OpenGLLightingContext:
             """
             self.__direction = direction  # type: np.ndarray
 
+            # Precompute the position to pass to OpenGL, so that it doesn't need to be recomputed each time.
+            self.__position = np.ascontiguousarray(-direction, dtype=np.float32)  # type: np.ndarray
+
         # PUBLIC METHODS
 
         def enable(self, light_id: int) -> None:
@@ -50,9 +57,9 @@ class OpenGLLightingContext:
             :param light_id:    The OpenGL light ID to use.
             """
             glEnable(light_id)
-            glLightfv(light_id, GL_DIFFUSE, np.array([1, 1, 1, 1]))
-            glLightfv(light_id, GL_SPECULAR, np.array([1, 1, 1, 1]))
-            glLightfv(light_id, GL_POSITION, -self.__direction)
+            glLightfv(light_id, GL_DIFFUSE, self.__WHITE)
+            glLightfv(light_id, GL_SPECULAR, self.__WHITE)
+            glLightfv(light_id, GL_POSITION, self.__position)
 
     # CONSTRUCTOR
 
@@ -62,21 +69,24 @@ class OpenGLLightingContext:
 
         :param lights:  The lights that should be temporarily enabled whilst the context is active.
         """
-        self.__lights = lights  # type: Dict[int, OpenGLLightingContext.Light]
+        # Note: We resolve the OpenGL light IDs up-front, and skip any slots without a light, so that activating
+        #       the context only needs to iterate over the lights that are actually present.
+        self.__lights = tuple(
+            (GL_LIGHT0 + i, light) for i, light in sorted(lights.items()) if 0 <= i < 8
+        )  # type: Tuple[Tuple[int, OpenGLLightingContext.Light], ...]
 
     # SPECIAL METHODS
 
     def __enter__(self):
         """Push the old lighting state onto the OpenGL stack and enable the new lighting state."""
-        glPushAttrib(GL_ENABLE_BIT | GL_LIGHTING_BIT)
+        # Note: GL_LIGHTING_BIT includes the enable bits for lighting, the lights and colour-based materials.
+        glPushAttrib(GL_LIGHTING_BIT)
 
         glEnable(GL_COLOR_MATERIAL)
         glEnable(GL_LIGHTING)
 
-        for i in range(8):
-            light = self.__lights.get(i)  # type: Optional[OpenGLLightingContext.Light]
-            if light is not None:
-                light.enable(GL_LIGHT0 + i)
+        for light_id, light in self.__lights:
+            light.enable(light_id)
 
         return self
 
@@ -1,17 +1,40 @@
+import ctypes
 import numpy as np
 
 from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_1_1 import glTexSubImage2D as raw_glTexSubImage2D
+from typing import Dict, Optional, Tuple
 
 
 class OpenGLTexture:
     """An OpenGL texture."""
 
+    # CONSTANTS
+
+    # The OpenGL pixel formats to use for images with different numbers of channels.
+    __FORMATS = {3: GL_RGB, 4: GL_RGBA}  # type: Dict[int, int]
+
     # CONSTRUCTOR
 
-    def __init__(self):
-        """Construct an OpenGL texture."""
-        self.__alive = True                   # type: bool
-        self.__texture_id = glGenTextures(1)  # type: int
+    def __init__(self, *, use_streaming: bool = False):
+        """
+        Construct an OpenGL texture.
+
+        .. note::
+            If streaming is enabled, repeated uploads of same-sized images via set_image are staged through a
+            persistently-mapped pixel buffer object, so that the transfer to the GPU can happen asynchronously.
+            This is worthwhile for textures that are updated every frame (e.g. to display a live video stream).
+
+        :param use_streaming:   Whether to stage repeated uploads of same-sized images via a pixel buffer object.
+        """
+        self.__alive = True                        # type: bool
+        self.__format = None                       # type: Optional[int]
+        self.__shape = None                        # type: Optional[Tuple[int, ...]]
+        self.__stream_buffer = None                # type: Optional[np.ndarray]
+        self.__stream_fence = None                 # type: Optional[int]
+        self.__stream_pbo_id = None                # type: Optional[int]
+        self.__texture_id = int(glGenTextures(1))  # type: int
+        self.__use_streaming = use_streaming       # type: bool
 
     # DESTRUCTOR
 
@@ -29,31 +52,61 @@ class OpenGLTexture:
         """Destroy the texture at the end of the with statement that's used to manage its lifetime."""
         self.terminate()
 
+    # PROPERTIES
+
+    @property
+    def texture_id(self) -> int:
+        """
+        Get the OpenGL ID of the texture.
+
+        :return:    The OpenGL ID of the texture.
+        """
+        return self.__texture_id
+
     # PUBLIC METHODS
 
     def bind(self) -> None:
         """Bind the texture."""
         glBindTexture(GL_TEXTURE_2D, self.__texture_id)
 
-    # noinspection PyMethodMayBeStatic
     def set_image(self, image: np.ndarray) -> None:
         """
         Set the image for the texture.
 
         .. note::
             The texture must be bound prior to calling this method.
+        .. note::
+            The texture storage is only (re)allocated when the shape of the image changes, so streaming a sequence
+            of same-sized images through the texture is relatively cheap.
 
         :param image:   The image to set.
         """
-        channels = image.shape[2]  # type: int
-        if channels == 3:
-            glTexImage2D(
-                GL_TEXTURE_2D, 0, GL_RGB, image.shape[1], image.shape[0], 0, GL_RGB, GL_UNSIGNED_BYTE, image
-            )
-        elif channels == 4:
+        # Make sure the image is a C-contiguous array of bytes, so that it can be handed straight to OpenGL
+        # without PyOpenGL needing to silently copy it. In the common case, this is a no-op.
+        image = OpenGLTexture.__make_uploadable(image)
+
+        # If the image has the same shape as the previous one, the existing texture storage and parameters can be
+        # reused, so just replace the contents of the texture.
+        if image.shape == self.__shape and self.__format is not None:
+            if self.__use_streaming:
+                self.__stream_image(image)
+            else:
+                self.update_image(image)
+            return
+
+        # Otherwise, (re)allocate the texture storage and set the texture parameters. Any pixel buffer object used
+        # for streaming images of the old shape is now the wrong size, so we also release it.
+        self.__release_stream_buffer()
+        self.__format = OpenGLTexture.__FORMATS.get(image.shape[2])
+        self.__shape = image.shape
+        if self.__format is not None:
+            pushed = OpenGLTexture.__push_unpack_alignment(image)  # type: bool
             glTexImage2D(
-                GL_TEXTURE_2D, 0, GL_RGBA, image.shape[1], image.shape[0], 0, GL_RGBA, GL_UNSIGNED_BYTE, image
+                GL_TEXTURE_2D, 0, self.__format, image.shape[1], image.shape[0], 0,
+                self.__format, GL_UNSIGNED_BYTE, image
             )
+            if pushed:
+                glPopClientAttrib()
 
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
@@ -62,18 +115,158 @@ class OpenGLTexture:
 
     def terminate(self) -> None:
         """Destroy the texture."""
-        if self.__alive:
-            try:
-                glDeleteTextures([self.__texture_id])
-            except Error:
-                # FIXME: It's good to be tidy and try to delete the texture, but it crashes sometimes, for reasons
-                #        I don't quite understand currently. For that reason, I'm currently suppressing the error,
-                #        on the basis that it's a fairly harmless one and crashing is worse.
-                pass
+        if not self.__alive:
+            return
+
+        # Note: The texture is marked as destroyed up-front, so that it won't be released twice even if something
+        #       goes wrong below.
+        self.__alive = False
 
-            self.__alive = False
+        self.__release_stream_buffer()
+
+        try:
+            glDeleteTextures([self.__texture_id])
+        except Error:
+            # FIXME: It's good to be tidy and try to delete the texture, but it crashes sometimes, for reasons
+            #        I don't quite understand currently. For that reason, I'm currently suppressing the error,
+            #        on the basis that it's a fairly harmless one and crashing is worse.
+            pass
 
     # noinspection PyMethodMayBeStatic
     def unbind(self) -> None:
         """Unbind the texture."""
         glBindTexture(GL_TEXTURE_2D, 0)
+
+    def update_image(self, image: np.ndarray, *, from_unpack_buffer: bool = False) -> None:
+        """
+        Replace the contents of the texture with the specified image, reusing the existing texture storage.
+
+        .. note::
+            The texture must be bound prior to calling this method.
+        .. note::
+            The image must have the same shape as the one most recently used to (re)allocate the texture storage.
+
+        :param image:               The image with which to replace the contents of the texture.
+        :param from_unpack_buffer:  Whether to read the pixel data from the currently bound pixel unpack buffer
+                                    rather than from the image itself (in which case only the image's shape is used).
+        """
+        # Note: Since the image has the same shape as the one most recently used to (re)allocate the texture storage,
+        #       we can reuse the pixel format that was determined then, rather than working it out again.
+        if self.__format is not None:
+            pushed = OpenGLTexture.__push_unpack_alignment(image)  # type: bool
+
+            if from_unpack_buffer:
+                # The pixel data is an offset into the unpack buffer rather than an array, so there's nothing for
+                # PyOpenGL's array handling to do, and we can call the raw ctypes binding directly.
+                raw_glTexSubImage2D(
+                    GL_TEXTURE_2D, 0, 0, 0, image.shape[1], image.shape[0], self.__format, GL_UNSIGNED_BYTE,
+                    ctypes.c_void_p(0)
+                )
+            else:
+                image = OpenGLTexture.__make_uploadable(image)
+                glTexSubImage2D(
+                    GL_TEXTURE_2D, 0, 0, 0, image.shape[1], image.shape[0], self.__format, GL_UNSIGNED_BYTE, image
+                )
+
+            if pushed:
+                glPopClientAttrib()
+
+    # PRIVATE METHODS
+
+    def __release_stream_buffer(self) -> None:
+        """Release the pixel buffer object (if any) that's being used to stream images to the texture."""
+        if self.__stream_pbo_id is None:
+            return
+
+        self.__stream_buffer = None
+
+        try:
+            if self.__stream_fence is not None:
+                glDeleteSync(self.__stream_fence)
+
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.__stream_pbo_id)
+            glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+            glDeleteBuffers(1, [self.__stream_pbo_id])
+        except Error:
+            # Note: As when deleting the texture, failing to delete the buffer is fairly harmless, whereas crashing
+            #       isn't.
+            pass
+
+        self.__stream_fence = None
+        self.__stream_pbo_id = None
+
+    def __stream_image(self, image: np.ndarray) -> None:
+        """
+        Replace the contents of the texture with the specified image, staging it through a persistently-mapped
+        pixel buffer object so that the transfer to the GPU can happen asynchronously.
+
+        .. note::
+            The texture must be bound prior to calling this method.
+        .. note::
+            The image must be a C-contiguous array of bytes, with the same shape as the one most recently used
+            to (re)allocate the texture storage.
+
+        :param image:   The image with which to replace the contents of the texture.
+        """
+        # If we haven't yet made the pixel buffer object, make it now. Its storage is immutable and mapped once
+        # and for all, so we can simply write each image straight into it, without any further calls into OpenGL.
+        if self.__stream_pbo_id is None:
+            flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT  # type: int
+            self.__stream_pbo_id = int(glGenBuffers(1))
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.__stream_pbo_id)
+            glBufferStorage(GL_PIXEL_UNPACK_BUFFER, image.nbytes, None, flags)
+            ptr = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, image.nbytes, flags)
+            data = ctypes.cast(ptr, ctypes.POINTER(ctypes.c_ubyte * image.nbytes)).contents
+            self.__stream_buffer = np.frombuffer(data, dtype=np.uint8).reshape(image.shape)
+        else:
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.__stream_pbo_id)
+
+        # If the GPU might still be reading the previous image from the buffer, wait for it to finish doing so.
+        # (In practice, the previous transfer will normally have completed long before the next image arrives.)
+        if self.__stream_fence is not None:
+            glClientWaitSync(self.__stream_fence, GL_SYNC_FLUSH_COMMANDS_BIT, GL_TIMEOUT_IGNORED)
+            glDeleteSync(self.__stream_fence)
+
+        # Copy the image into the buffer, and start the transfer from the buffer to the texture.
+        np.copyto(self.__stream_buffer, image)
+        self.update_image(image, from_unpack_buffer=True)
+        self.__stream_fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+    # PRIVATE STATIC METHODS
+
+    @staticmethod
+    def __make_uploadable(image: np.ndarray) -> np.ndarray:
+        """
+        Make sure that an image is a C-contiguous array of bytes, copying it only if necessary.
+
+        :param image:   The image.
+        :return:        The image, or a C-contiguous copy of it with a dtype of np.uint8 (if it wasn't one already).
+        """
+        if image.dtype != np.uint8 or not image.flags["C_CONTIGUOUS"]:
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+        return image
+
+    @staticmethod
+    def __push_unpack_alignment(image: np.ndarray) -> bool:
+        """
+        If the rows of an image aren't 4-byte aligned (as OpenGL assumes by default), save the current pixel store
+        state and tell OpenGL that the rows are tightly packed.
+
+        .. note::
+            This stops OpenGL misreading images whose rows aren't a multiple of 4 bytes long (e.g. RGB images with
+            odd widths), without changing any state for the (more common) images whose rows are suitably aligned.
+        .. note::
+            If this returns True, the caller must call glPopClientAttrib once the image has been uploaded.
+
+        :param image:   The image (which must be C-contiguous).
+        :return:        True, if the pixel store state was saved and changed, or False otherwise.
+        """
+        if (image.shape[1] * image.shape[2]) % 4 == 0:
+            return False
+
+        glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        return True
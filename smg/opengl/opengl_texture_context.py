@@ -1,10 +1,29 @@
+import threading
+
 from OpenGL.GL import *
+from typing import List, Optional
 
 from .opengl_texture import OpenGLTexture
 
 
 class OpenGLTextureContext:
-    """Used to allow the current OpenGL texture to be temporarily changed and then restored later."""
+    """
+    Used to allow the current OpenGL texture to be temporarily changed and then restored later.
+
+    .. note::
+        When texture contexts are nested, the texture bound by each active context is tracked, so that redundant
+        state changes can be skipped: texturing is only enabled (and the enable state saved) by the outermost
+        context, and a texture is only (re)bound if it isn't already the current one. When an inner context is
+        exited, the texture of the context enclosing it is bound again. For this to work, any code within a
+        context that changes the texture binding directly must restore it before the context is exited. The
+        active contexts are tracked per thread, since each thread has its own current OpenGL context.
+    """
+
+    # PRIVATE STATIC VARIABLES
+
+    # The per-thread state. For each thread, this contains the IDs of the textures used by the texture contexts
+    # that are currently active on that thread, from the outermost inwards (texture_ids).
+    __thread_local = threading.local()
 
     # CONSTRUCTOR
 
@@ -19,13 +38,41 @@ class OpenGLTextureContext:
     # SPECIAL METHODS
 
     def __enter__(self):
-        """No-op (needed to allow the context's lifetime to be managed by a with statement)."""
-        glPushAttrib(GL_ENABLE_BIT)
-        glEnable(GL_TEXTURE_2D)
-        self.__texture.bind()
+        """Enable texturing (if necessary) and bind the context's texture (if it isn't already bound)."""
+        texture_ids = OpenGLTextureContext.__get_texture_ids()  # type: List[int]
+        texture_id = self.__texture.texture_id                 # type: int
+
+        if len(texture_ids) == 0:
+            glPushAttrib(GL_ENABLE_BIT)
+            glEnable(GL_TEXTURE_2D)
+            self.__texture.bind()
+        elif texture_ids[-1] != texture_id:
+            self.__texture.bind()
+
+        texture_ids.append(texture_id)
         return self
 
     def __exit__(self, exception_type, exception_value, traceback):
-        """Destroy the context at the end of the with statement that's used to manage its lifetime."""
-        self.__texture.unbind()
-        glPopAttrib()
+        """Restore the texture binding (and, if necessary, the enable state) that were current before the context."""
+        texture_ids = OpenGLTextureContext.__get_texture_ids()  # type: List[int]
+        texture_id = texture_ids.pop()                         # type: int
+
+        if len(texture_ids) == 0:
+            self.__texture.unbind()
+            glPopAttrib()
+        elif texture_ids[-1] != texture_id:
+            glBindTexture(GL_TEXTURE_2D, texture_ids[-1])
+
+    # PRIVATE STATIC METHODS
+
+    @staticmethod
+    def __get_texture_ids() -> List[int]:
+        """
+        Get the IDs of the textures used by the texture contexts that are currently active on the current thread.
+
+        :return:    The IDs of the textures used by the active texture contexts, from the outermost inwards.
+        """
+        texture_ids = getattr(OpenGLTextureContext.__thread_local, "texture_ids", None)  # type: Optional[List[int]]
+        if texture_ids is None:
+            texture_ids = OpenGLTextureContext.__thread_local.texture_ids = []
+        return texture_ids
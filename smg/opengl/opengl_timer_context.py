@@ -0,0 +1,139 @@
+import numpy as np
+import threading
+
+from OpenGL.GL import *
+from typing import Dict, List, Tuple
+
+
+class OpenGLTimerContext:
+    """
+    Used to measure how long the GPU takes to execute the OpenGL commands issued within a with statement.
+
+    .. note::
+        Timer contexts can be nested, in which case each is identified by the path of names from the outermost one
+        down (e.g. "frame/scene"), and can be combined with the other OpenGL contexts (e.g. via contextlib.ExitStack).
+    .. note::
+        The timings are collected asynchronously using timestamp queries, so as to avoid stalling the CPU until
+        the GPU catches up. To collect the timings that have become available, call poll once per frame.
+    .. note::
+        Query objects belong to a particular OpenGL context, so all of the timing state is kept per thread (OpenGL
+        contexts are per-thread). Timings must thus be polled for and retrieved on the thread that recorded them.
+    """
+
+    # CONSTANTS
+
+    # The number of timestamp queries to allocate whenever more are needed.
+    __QUERY_BATCH_SIZE = 32  # type: int
+
+    # PRIVATE STATIC VARIABLES
+
+    # The per-thread timing state. For each thread, this contains:
+    #   free_query_ids: The IDs of the timestamp queries that aren't currently in use.
+    #   paths: The paths of the active timer contexts, from the outermost one inwards.
+    #   pending: The (path, start query ID, end query ID) triples for the contexts whose timings haven't yet been
+    #            collected.
+    #   timings: The most recently collected timing (in seconds) for each context path.
+    __thread_local = threading.local()
+
+    # CONSTRUCTOR
+
+    def __init__(self, name: str):
+        """
+        Construct an OpenGL timer context.
+
+        :param name:    The name of the context.
+        """
+        self.__name = name         # type: str
+        self.__path = ""           # type: str
+        self.__start_query_id = 0  # type: int
+
+    # SPECIAL METHODS
+
+    def __enter__(self):
+        """Record a timestamp on the GPU at the point when the context is entered."""
+        paths = OpenGLTimerContext.__get_state().paths  # type: List[str]
+        self.__path = paths[-1] + "/" + self.__name if len(paths) > 0 else self.__name
+        paths.append(self.__path)
+
+        self.__start_query_id = OpenGLTimerContext.__acquire_query()
+        glQueryCounter(self.__start_query_id, GL_TIMESTAMP)
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        """Record a timestamp on the GPU at the point when the context is exited."""
+        end_query_id = OpenGLTimerContext.__acquire_query()  # type: int
+        glQueryCounter(end_query_id, GL_TIMESTAMP)
+
+        state = OpenGLTimerContext.__get_state()
+        state.pending.append((self.__path, self.__start_query_id, end_query_id))
+        state.paths.pop()
+
+    # PUBLIC STATIC METHODS
+
+    @staticmethod
+    def get_timings() -> Dict[str, float]:
+        """
+        Get the most recently collected timing (in seconds) for each timer context path.
+
+        :return:    A dictionary mapping each timer context path to its most recently collected timing.
+        """
+        return dict(OpenGLTimerContext.__get_state().timings)
+
+    @staticmethod
+    def poll() -> None:
+        """
+        Collect the timings for any timer contexts whose timestamp queries have completed, without blocking.
+
+        .. note::
+            Timings will typically become available a frame or two after the contexts concerned are exited.
+        """
+        state = OpenGLTimerContext.__get_state()
+        pending = state.pending  # type: List[Tuple[str, int, int]]
+        collected = 0            # type: int
+
+        # Note: Queries complete in the order in which they were issued, so we can stop at the first one whose
+        #       result isn't yet available.
+        for path, start_query_id, end_query_id in pending:
+            if not glGetQueryObjectiv(end_query_id, GL_QUERY_RESULT_AVAILABLE):
+                break
+
+            start_time = glGetQueryObjectui64v(start_query_id, GL_QUERY_RESULT)  # type: int
+            end_time = glGetQueryObjectui64v(end_query_id, GL_QUERY_RESULT)      # type: int
+            state.timings[path] = (end_time - start_time) / 1e9
+            state.free_query_ids += [start_query_id, end_query_id]
+            collected += 1
+
+        del pending[:collected]
+
+    # PRIVATE STATIC METHODS
+
+    @staticmethod
+    def __acquire_query() -> int:
+        """
+        Acquire a timestamp query that isn't currently in use, allocating more queries if necessary.
+
+        :return:    The ID of the query.
+        """
+        state = OpenGLTimerContext.__get_state()
+        if len(state.free_query_ids) == 0:
+            state.free_query_ids = [
+                int(i) for i in np.atleast_1d(glGenQueries(OpenGLTimerContext.__QUERY_BATCH_SIZE))
+            ]
+
+        return state.free_query_ids.pop()
+
+    @staticmethod
+    def __get_state() -> threading.local:
+        """
+        Get the timing state for the current thread, initialising it if necessary.
+
+        :return:    The timing state for the current thread.
+        """
+        state = OpenGLTimerContext.__thread_local  # type: threading.local
+        if not hasattr(state, "pending"):
+            state.free_query_ids = []  # type: List[int]
+            state.paths = []           # type: List[str]
+            state.pending = []         # type: List[Tuple[str, int, int]]
+            state.timings = {}         # type: Dict[str, float]
+
+        return state
@@ -2,77 +2,317 @@ import numpy as np
 
 from OpenGL.arrays.vbo import VBO
 from OpenGL.GL import *
-from typing import Optional
+from OpenGL.raw.GL.VERSION.GL_1_2 import glDrawRangeElements as raw_glDrawRangeElements
+from typing import Dict, List, Optional, Tuple
 
 
 class OpenGLTriMesh:
     """An immutable triangle mesh (stored in a format that can be rendered efficiently by OpenGL)."""
 
+    # CONSTANTS
+
+    # The layouts of the packed vertex data for meshes without and with vertex normals. The strides and offsets
+    # of the vertex attributes on the GPU are derived from these, so changing them is all that's needed to change
+    # how the attributes are stored (provided the GL types used when rendering are kept in sync).
+    __VERTEX_DTYPE = np.dtype([
+        ("position", np.float32, 3), ("colour", np.uint8, 4)
+    ])  # type: np.dtype
+    __VERTEX_DTYPE_WITH_NORMALS = np.dtype([
+        ("position", np.float32, 3), ("colour", np.uint8, 4), ("normal", np.float32, 3)
+    ])  # type: np.dtype
+
     # CONSTRUCTOR
 
     def __init__(self, vertices: np.ndarray, vertex_colours: np.ndarray, triangles: np.ndarray, *,
-                 vertex_normals: Optional[np.ndarray] = None):
+                 vertex_normals: Optional[np.ndarray] = None, optimise_vertex_order: bool = False,
+                 interleave_attributes: bool = True):
         """
         Construct an immutable OpenGL triangle mesh.
 
-        :param vertices:        The mesh vertices, as an n*3 array with a dtype of np.float64.
-        :param vertex_colours:  The mesh vertex colours, as an n*3 array with a dtype of np.float64.
-        :param triangles:       The mesh triangles, as an m*3 index array with a dtype of int.
-        :param vertex_normals:  The mesh vertex normals, as an n*3 array with a dtype of np.float64 (optional).
+        :param vertices:                The mesh vertices, as an n*3 floating-point array.
+        :param vertex_colours:          The mesh vertex colours, as an n*3 floating-point array (in the range [0,1]).
+        :param triangles:               The mesh triangles, as an m*3 index array with a dtype of int.
+        :param vertex_normals:          The mesh vertex normals, as an n*3 floating-point array (optional).
+        :param optimise_vertex_order:   Whether to reorder the vertices into the order in which the triangles
+                                        first use them (note that this drops any vertices that the triangles
+                                        don't use, and costs an extra pass over the triangles to find the order).
+        :param interleave_attributes:   Whether to interleave the vertex attributes in a single vertex buffer object
+                                        (as opposed to storing each attribute in a separate one). Interleaving is
+                                        generally the better choice, but some GPUs/drivers do better without it.
         """
         # See: http://pyopengl.sourceforge.net/context/tutorials/shader_2.html.
-
-        # Check that the vertices and vertex_colours arrays have the right dtype, and raise an exception if not.
-        if vertices.dtype != np.float64 or vertex_colours.dtype != np.float64:
-            raise RuntimeError("The vertices and vertex_colours arrays must have a dtype of np.float64")
-
-        # If the mesh vertex normals have been specified:
+        self.__alive = False                             # type: bool
         self.__use_normals = vertex_normals is not None  # type: bool
+
+        # Pack the vertices, vertex colours and (if specified) vertex normals into a single array, interleaved.
+        # To avoid any unnecessary temporaries, we write each array directly into its fields of a single
+        # pre-allocated buffer. Note that we store the vertices and normals in single precision, since GPUs
+        # generally have no native support for double-precision vertex attributes, and so would only end up
+        # converting them anyway. Similarly, we store the colours as 8-bit RGBA, since that's all the precision
+        # they'll end up with in the frame buffer.
+        dtype = OpenGLTriMesh.__VERTEX_DTYPE_WITH_NORMALS if self.__use_normals else OpenGLTriMesh.__VERTEX_DTYPE
+        interleaved = np.empty(len(vertices), dtype=dtype)  # type: np.ndarray
+        interleaved["position"] = vertices
+        interleaved["colour"][:, 3] = 255
         if self.__use_normals:
-            # Check that they have the right dtype, and raise an exception if not.
-            if vertex_normals.dtype != np.float64:
-                raise RuntimeError("If specified, the vertex normals array must have a dtype of np.float64")
+            interleaved["normal"] = vertex_normals
 
-            # Make a vertex buffer object that contains the vertices, vertex colours and vertex normals, interleaved.
-            self.__vbo = VBO(np.concatenate([vertices, vertex_colours, vertex_normals], axis=1))  # type: VBO
-        else:
-            # Otherwise, make a vertex buffer object that contains only the vertices and vertex colours, interleaved.
-            self.__vbo = VBO(np.concatenate([vertices, vertex_colours], axis=1))  # type: VBO
+        # Note: The colours are quantised in place in a single temporary array, to avoid making several of them.
+        colours = vertex_colours * 255.0  # type: np.ndarray
+        colours += 0.5
+        np.clip(colours, 0.0, 255.0, out=colours)
+        interleaved["colour"][:, :3] = colours
+
+        # If requested, reorder the vertices so that the GPU fetches them as sequentially as possible. Note that
+        # we do this after packing the vertex data, so that it can be done with a single pass over the packed
+        # buffer, rather than a pass over each of the (larger) input arrays.
+        if optimise_vertex_order:
+            vertex_order, triangles = OpenGLTriMesh.__optimise_vertex_order(triangles, len(interleaved))
+            interleaved = interleaved[vertex_order]
+
+        # Make the vertex buffer object(s) from the packed vertex data.
+        self.__interleave_attributes = interleave_attributes  # type: bool
+        self.__vertex_data = interleaved                      # type: np.ndarray
+        self.__vbos = OpenGLTriMesh.__make_vertex_buffers(interleaved, interleave_attributes)  # type: Dict[str, VBO]
 
         # Make a vertex buffer object from the index array specifying the mesh triangles.
-        self.__ibo = VBO(triangles, target=GL_ELEMENT_ARRAY_BUFFER)  # type: VBO
+        self.__ibo, self.__index_type = OpenGLTriMesh.__make_index_buffer(triangles, len(interleaved))
+        self.__index_count = triangles.size                                # type: int
+        self.__index_range = OpenGLTriMesh.__get_index_range(triangles)  # type: Tuple[int, int]
+
+        # Make a vertex array object that records how the buffers should be bound for rendering.
+        self.__vao = self.__make_vertex_array()  # type: int
+
+        # Mark construction of the mesh as having finished successfully.
+        self.__alive = True
+
+    # DESTRUCTOR
+
+    def __del__(self):
+        """Destroy the mesh."""
+        try:
+            self.terminate()
+        except ImportError:
+            pass
+
+    # SPECIAL METHODS
+
+    def __enter__(self):
+        """No-op (needed to allow the mesh's lifetime to be managed by a with statement)."""
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        """Destroy the mesh at the end of the with statement that's used to manage its lifetime."""
+        self.terminate()
+
+    # PUBLIC STATIC METHODS
+
+    @staticmethod
+    def concatenate(meshes: List["OpenGLTriMesh"]) -> "OpenGLTriMesh":
+        """
+        Make a single triangle mesh that contains all of the triangles of the specified meshes.
+
+        .. note::
+            Rendering the combined mesh needs only a single draw call, rather than one per mesh, so it's worth
+            doing this for scenes that contain many small meshes that are always rendered together.
+        .. note::
+            The meshes must either all have vertex normals, or all not have them.
+        .. note::
+            The combined mesh will store its vertex attributes in the same way (interleaved or not) as the first mesh.
+
+        :param meshes:  The meshes to concatenate.
+        :return:        The combined mesh.
+        """
+        if len(meshes) == 0:
+            raise RuntimeError("At least one mesh must be specified")
+
+        use_normals = meshes[0].__use_normals  # type: bool
+        if any(mesh.__use_normals != use_normals for mesh in meshes):
+            raise RuntimeError("Either all of the meshes must have vertex normals, or none of them may")
+
+        # Concatenate the packed vertex data of the meshes, and their triangles (offsetting the vertex indices
+        # in the triangles of each mesh by the number of vertices in the meshes that precede it). Note that the
+        # indices of each mesh are widened before offsetting them, since they may be stored using only 16 bits.
+        vertex_data = np.concatenate([mesh.__vertex_data for mesh in meshes], axis=0)  # type: np.ndarray
+
+        triangles = []  # type: List[np.ndarray]
+        offset = 0      # type: int
+        for mesh in meshes:
+            triangles.append(mesh.__ibo.data.astype(np.uint32) + offset)
+            offset += len(mesh.__vertex_data)
+
+        # Make the combined mesh directly from the concatenated data.
+        result = OpenGLTriMesh.__new__(OpenGLTriMesh)  # type: OpenGLTriMesh
+        result.__alive = False
+        result.__use_normals = use_normals
+        result.__interleave_attributes = meshes[0].__interleave_attributes
+        result.__vertex_data = vertex_data
+        result.__vbos = OpenGLTriMesh.__make_vertex_buffers(vertex_data, result.__interleave_attributes)
+        result.__ibo, result.__index_type = OpenGLTriMesh.__make_index_buffer(
+            np.concatenate(triangles, axis=0), offset
+        )
+        result.__index_count = result.__ibo.data.size
+        result.__index_range = OpenGLTriMesh.__get_index_range(result.__ibo.data)
+        result.__vao = result.__make_vertex_array()
+        result.__alive = True
+        return result
 
     # PUBLIC METHODS
 
     def render(self) -> None:
         """Render the triangle mesh."""
+        # Note: Since the indices come from the index buffer recorded in the vertex array object, there's nothing
+        #       for PyOpenGL's array handling to do, so we call the raw ctypes binding to avoid its per-call overhead.
+        #       We also tell OpenGL the range of vertices the indices refer to, which can help the driver.
+        glBindVertexArray(self.__vao)
+        start, end = self.__index_range
+        raw_glDrawRangeElements(GL_TRIANGLES, start, end, self.__index_count, self.__index_type, None)
+        glBindVertexArray(0)
+
+    def terminate(self) -> None:
+        """Destroy the mesh."""
+        if not self.__alive:
+            return
+
+        # Note: As with the textures, the mesh is marked as destroyed up-front, so that it won't be released twice
+        #       even if something goes wrong below.
+        self.__alive = False
+
         try:
-            # Prepare to render the triangles.
-            self.__vbo.bind()
-            self.__ibo.bind()
-
-            glEnableClientState(GL_VERTEX_ARRAY)
-            glEnableClientState(GL_COLOR_ARRAY)
-
-            if self.__use_normals:
-                glEnableClientState(GL_NORMAL_ARRAY)
-
-                glVertexPointer(3, GL_DOUBLE, 72, self.__vbo)
-                glColorPointer(3, GL_DOUBLE, 72, self.__vbo + 24)
-                glNormalPointer(GL_DOUBLE, 72, self.__vbo + 48)
-            else:
-                glVertexPointer(3, GL_DOUBLE, 48, self.__vbo)
-                glColorPointer(3, GL_DOUBLE, 48, self.__vbo + 24)
-
-            # Render the triangles.
-            glDrawElements(GL_TRIANGLES, len(self.__ibo) * 3, GL_UNSIGNED_INT, self.__ibo)
-        finally:
-            # Clean up after rendering the triangles.
-            if self.__use_normals:
-                glDisableClientState(GL_NORMAL_ARRAY)
-
-            glDisableClientState(GL_COLOR_ARRAY)
-            glDisableClientState(GL_VERTEX_ARRAY)
-
-            self.__ibo.unbind()
-            self.__vbo.unbind()
+            glDeleteVertexArrays(1, [self.__vao])
+            self.__ibo.delete()
+            for vbo in set(self.__vbos.values()):
+                vbo.delete()
+        except Error:
+            # Note: As with the textures, failing to delete the buffers is fairly harmless (e.g. if the context has
+            #       already been destroyed by the time the mesh is collected), whereas crashing isn't.
+            pass
+
+    # PRIVATE METHODS
+
+    def __make_vertex_array(self) -> int:
+        """
+        Make a vertex array object that captures the bindings and vertex layout needed to render the mesh.
+
+        .. note::
+            This allows render to bind everything it needs with a single call, rather than re-specifying the
+            vertex layout every time the mesh is rendered.
+
+        :return:    The ID of the vertex array object.
+        """
+        vao = int(glGenVertexArrays(1))  # type: int
+        glBindVertexArray(vao)
+
+        self.__ibo.bind()
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        vbo, stride, offset = self.__get_attribute_layout("position")
+        vbo.bind()
+        glVertexPointer(3, GL_FLOAT, stride, vbo + offset)
+
+        glEnableClientState(GL_COLOR_ARRAY)
+        vbo, stride, offset = self.__get_attribute_layout("colour")
+        vbo.bind()
+        glColorPointer(4, GL_UNSIGNED_BYTE, stride, vbo + offset)
+
+        if self.__use_normals:
+            glEnableClientState(GL_NORMAL_ARRAY)
+            vbo, stride, offset = self.__get_attribute_layout("normal")
+            vbo.bind()
+            glNormalPointer(GL_FLOAT, stride, vbo + offset)
+
+        # Note: The vertex array object must be unbound before the index buffer, since the index buffer binding
+        #       is part of the state it records.
+        glBindVertexArray(0)
+        self.__ibo.unbind()
+        vbo.unbind()
+
+        return vao
+
+    def __get_attribute_layout(self, name: str) -> Tuple[VBO, int, int]:
+        """
+        Get where and how the specified vertex attribute is stored on the GPU.
+
+        :param name:    The name of the vertex attribute (e.g. "position").
+        :return:        A tuple consisting of the vertex buffer object containing the attribute, and the stride and
+                        byte offset of the attribute within it.
+        """
+        if self.__interleave_attributes:
+            dtype = self.__vertex_data.dtype  # type: np.dtype
+            return self.__vbos[name], dtype.itemsize, dtype.fields[name][1]
+        else:
+            return self.__vbos[name], 0, 0
+
+    # PRIVATE STATIC METHODS
+
+    @staticmethod
+    def __get_index_range(indices: np.ndarray) -> Tuple[int, int]:
+        """
+        Get the smallest and largest vertex indices in an index array.
+
+        :param indices: The index array.
+        :return:        A tuple consisting of the smallest and largest indices (or (0, 0) if the array is empty).
+        """
+        if indices.size == 0:
+            return 0, 0
+        else:
+            return int(indices.min()), int(indices.max())
+
+    @staticmethod
+    def __make_index_buffer(triangles: np.ndarray, vertex_count: int) -> Tuple[VBO, int]:
+        """
+        Make a vertex buffer object from the index array specifying the triangles of a mesh.
+
+        .. note::
+            The indices are stored using 16 bits if possible, and 32 bits otherwise. For the many meshes that have
+            no more than 65536 vertices, this halves the amount of index data that the GPU has to fetch.
+
+        :param triangles:       The mesh triangles, as an m*3 index array.
+        :param vertex_count:    The number of vertices in the mesh.
+        :return:                A tuple consisting of the vertex buffer object, and the OpenGL type of its indices.
+        """
+        if vertex_count <= 0x10000:
+            return VBO(triangles.astype(np.uint16), target=GL_ELEMENT_ARRAY_BUFFER), GL_UNSIGNED_SHORT
+        else:
+            return VBO(triangles.astype(np.uint32), target=GL_ELEMENT_ARRAY_BUFFER), GL_UNSIGNED_INT
+
+    @staticmethod
+    def __make_vertex_buffers(vertex_data: np.ndarray, interleave_attributes: bool) -> Dict[str, VBO]:
+        """
+        Make the vertex buffer object(s) that store the packed vertex data of a mesh on the GPU.
+
+        :param vertex_data:             The packed vertex data of the mesh.
+        :param interleave_attributes:   Whether to interleave the vertex attributes in a single vertex buffer object
+                                        (as opposed to storing each attribute in a separate one).
+        :return:                        A dictionary mapping the name of each vertex attribute to the vertex buffer
+                                        object in which it's stored.
+        """
+        if interleave_attributes:
+            # Note: The packed data is passed to OpenGL as a plain array of bytes, with one row per vertex.
+            vbo = VBO(vertex_data.view(np.uint8).reshape(-1, vertex_data.dtype.itemsize))  # type: VBO
+            return {name: vbo for name in vertex_data.dtype.names}
+        else:
+            return {name: VBO(np.ascontiguousarray(vertex_data[name])) for name in vertex_data.dtype.names}
+
+    @staticmethod
+    def __optimise_vertex_order(triangles: np.ndarray, vertex_count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute an order for the vertices of a mesh in which they are first used by its triangles.
+
+        .. note::
+            Storing the vertices in this order means that consecutive triangles tend to refer to nearby vertices,
+            which makes vertex fetching on the GPU much more cache-friendly. Any vertices that aren't used by the
+            triangles are dropped.
+
+        :param triangles:       The mesh triangles, as an m*3 index array.
+        :param vertex_count:    The number of vertices in the mesh.
+        :return:                A tuple consisting of the indices of the vertices in their new order, and the
+                                triangles, rewritten to refer to the vertices in their new order.
+        """
+        used_vertices, first_uses = np.unique(triangles.ravel(), return_index=True)
+        vertex_order = used_vertices[np.argsort(first_uses)]  # type: np.ndarray
+
+        new_indices = np.empty(vertex_count, dtype=triangles.dtype)  # type: np.ndarray
+        new_indices[vertex_order] = np.arange(len(vertex_order))
+
+        return vertex_order, new_indices[triangles]
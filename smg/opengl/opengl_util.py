@@ -1,21 +1,142 @@
+import ctypes
+import math
 import numpy as np
+import threading
+import weakref
 
+from functools import lru_cache
+from OpenGL import contextdata
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from typing import List, Optional, Tuple
+from OpenGL.raw.GL.VERSION.GL_1_0 import glReadPixels as raw_glReadPixels
+from OpenGL.raw.GL.VERSION.GL_1_1 import glDrawArrays as raw_glDrawArrays
+from OpenGL.raw.GL.VERSION.GL_1_1 import glDrawElements as raw_glDrawElements
+from OpenGL.raw.GL.VERSION.GL_1_5 import glBufferData as raw_glBufferData
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-from smg.rigging.cameras import SimpleCamera
-from smg.rigging.helpers import CameraPoseConverter
 from smg.utility import GeometryUtil
 
+# If Numba is available, use it to compile a fused, parallel kernel for depth image linearisation (without Numba, we
+# fall back to evaluating the same expression using NumPy).
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None:
+    # Note: The kernel is cached on disk, so that its compilation cost is only paid once rather than by every process
+    #       that reads a depth image. It's deliberately compiled without fastmath, so that its results are identical
+    #       to those of the NumPy fallback.
+    @numba.njit(parallel=True, cache=True)
+    def _linearise_depth_image_kernel(depth_image: np.ndarray, numerator: float, scale: float, offset: float,
+                                      z_eye: np.ndarray) -> None:
+        """
+        Convert an image containing raw depth buffer values into one containing eye-space depths, in a single pass.
+
+        .. note::
+            Each eye-space depth is computed as numerator / (d * scale + offset), where d is the raw depth value.
+            The coefficients should have the same type as the elements of the output image.
+
+        :param depth_image: The image containing the raw depth buffer values (in the range [0,1]).
+        :param numerator:   The numerator of the expression (n * f, for near and far plane distances n and f).
+        :param scale:       The factor by which to scale each raw depth value (n - f).
+        :param offset:      The offset to add to each scaled raw depth value (f).
+        :param z_eye:       The output image into which to write the eye-space depths.
+        """
+        for i in numba.prange(depth_image.shape[0]):
+            for j in range(depth_image.shape[1]):
+                z_eye[i, j] = numerator / (depth_image[i, j] * scale + offset)
+
+
+def _make_oriented_cylinder_matrix(px: float, py: float, pz: float, ax: float, ay: float, az: float) -> np.ndarray:
+    """
+    Make the matrix that transforms a GLU cylinder drawn along the z axis so that its base is centred at p and its
+    axis points along a.
+
+    .. note::
+        This works on scalars rather than small numpy arrays, since for vectors this small, the overhead of calling
+        into numpy dwarfs the arithmetic itself.
+
+    :param px:  The x coordinate of the centre of the base of the cylinder.
+    :param py:  The y coordinate of the centre of the base of the cylinder.
+    :param pz:  The z coordinate of the centre of the base of the cylinder.
+    :param ax:  The x component of the cylinder's axis.
+    :param ay:  The y component of the cylinder's axis.
+    :param az:  The z component of the cylinder's axis.
+    :return:    The matrix, as a 16-element single-precision array in column-major order.
+    """
+    # Compute the axes of a camera positioned at the centre of the base of the cylinder and looking along its axis,
+    # in the same way as SimpleCamera would.
+    # Note: Since n is a unit vector, the squared length of its cross product with (0,-1,0) is 1 - n_y^2, so we can
+    #       tell whether the default up vector would be degenerate from n_y alone.
+    length = math.sqrt(ax * ax + ay * ay + az * az)
+    nx, ny, nz = ax / length, ay / length, az / length
+    if 1.0 - ny * ny < 1e-6:
+        upx, upy, upz = 1.0, 0.0, 0.0
+    else:
+        upx, upy, upz = 0.0, -1.0, 0.0
+
+    ux, uy, uz = upy * nz - upz * ny, upz * nx - upx * nz, upx * ny - upy * nx
+    length = math.sqrt(ux * ux + uy * uy + uz * uz)
+    ux, uy, uz = ux / length, uy / length, uz / length
+
+    vx, vy, vz = ny * uz - nz * uy, nz * ux - nx * uz, nx * uy - ny * ux
+
+    # Construct the camera-to-world transform, in column-major order. Since the camera's x and y axes are -u and -v,
+    # this is the same as np.linalg.inv(CameraPoseConverter.camera_to_pose(camera)), but avoids both the camera and
+    # the inversion.
+    m = np.zeros(16, dtype=np.float32)
+    m[0], m[1], m[2] = -ux, -uy, -uz
+    m[4], m[5], m[6] = -vx, -vy, -vz
+    m[8], m[9], m[10] = nx, ny, nz
+    m[12], m[13], m[14] = px, py, pz
+    m[15] = 1.0
+    return m
+
 
 class OpenGLUtil:
     """Utility functions related to OpenGL."""
 
+    # CONSTANTS
+
+    # The projection matrix for 2D rendering, i.e. glOrtho(0.0, 1.0, 0.0, 1.0, 0.0, 1.0), in column-major order.
+    __PROJECTION_MATRIX_2D = np.array([
+        [2.0, 0.0, 0.0, -1.0],
+        [0.0, 2.0, 0.0, -1.0],
+        [0.0, 0.0, -2.0, -1.0],
+        [0.0, 0.0, 0.0, 1.0]
+    ], dtype=np.float32).flatten(order='F')  # type: np.ndarray
+
+    # The model-view matrix for 2D rendering, which flips the y axis so that (0,0) is at the top-left of the
+    # viewport, i.e. a translation by (0,1,0), followed by a scaling by (1,-1,1), in column-major order.
+    __MODELVIEW_MATRIX_2D = np.array([
+        [1.0, 0.0, 0.0, 0.0],
+        [0.0, -1.0, 0.0, 1.0],
+        [0.0, 0.0, 1.0, 0.0],
+        [0.0, 0.0, 0.0, 1.0]
+    ], dtype=np.float32).flatten(order='F')  # type: np.ndarray
+
+    # PRIVATE STATIC VARIABLES
+
+    # The OpenGL objects (e.g. vertex buffer objects) that have been cached for later reuse, keyed by the OpenGL
+    # context in which they were created (object names are only meaningful in the context that created them).
+    __context_caches = {}  # type: Dict[Any, Dict[str, Any]]
+
+    # Per-thread scratch state. This only contains CPU-side buffers (no OpenGL objects), so it doesn't depend on
+    # which OpenGL context is current.
+    __thread_local = threading.local()
+
     # NESTED CLASSES
 
     class GLUQuadricWrapper:
-        """A wrapper around a GLU quadric."""
+        """
+        A wrapper around a GLU quadric.
+
+        .. note::
+            The wrapper is intended to have its lifetime managed by a with statement (or an explicit call to
+            terminate), so it deliberately has no __del__ method. As a safety net, if it creates its own quadric,
+            it registers a lightweight finaliser that will delete the quadric if the wrapper is never terminated.
+        """
 
         # CONSTRUCTOR
         def __init__(self, quadric: Optional[GLUquadric] = None):
@@ -25,14 +146,14 @@ class OpenGLUtil:
             :param quadric:     An optional existing GLU quadric to wrap (if none is specified,
                                 one will be created on the fly).
             """
-            self.__alive = True                                                   # type: bool
-            self.__quadric = quadric if quadric is not None else gluNewQuadric()  # type: GLUquadric
-
-        # DESTRUCTOR
+            self.__alive = True  # type: bool
 
-        def __del__(self):
-            """Destroy the quadric wrapper."""
-            self.terminate()
+            if quadric is not None:
+                self.__finaliser = None   # type: Optional[weakref.finalize]
+                self.__quadric = quadric  # type: GLUquadric
+            else:
+                self.__quadric = gluNewQuadric()
+                self.__finaliser = weakref.finalize(self, gluDeleteQuadric, self.__quadric)
 
         # SPECIAL METHODS
 
@@ -53,7 +174,11 @@ class OpenGLUtil:
         def terminate(self) -> None:
             """Destroy the quadric wrapper."""
             if self.__alive:
-                gluDeleteQuadric(self.__quadric)
+                # Note: Calling the finaliser (if any) deletes the quadric and stops it being deleted again later.
+                if self.__finaliser is not None:
+                    self.__finaliser()
+                else:
+                    gluDeleteQuadric(self.__quadric)
                 self.__alive = False
 
     class OrientedCylinderContext:
@@ -72,27 +197,17 @@ class OpenGLUtil:
             :param base_centre: The centre of the base of the cylinder.
             :param axis:        The cylinder's axis (a vector from the centre of its base to the centre of its top).
             """
-            self.__base_centre = base_centre  # type: np.ndarray
-            self.__axis = axis                # type: np.ndarray
+            # Note: The matrix is computed once here rather than every time the context is entered, so that a
+            #       context can cheaply be reused to draw the same cylinder several times (e.g. once per frame).
+            self.__m = _make_oriented_cylinder_matrix(*base_centre, *axis)  # type: np.ndarray
 
         # SPECIAL METHODS
 
         def __enter__(self):
             """Modify the model-view matrix to arrange for the cylinder to be drawn in the right place."""
-            # Make a camera positioned at the centre of the base of the cylinder and looking along its axis.
-            n = self.__axis / np.linalg.norm(self.__axis)     # type: np.ndarray
-            up = np.array([0.0, -1.0, 0.0])                   # type: np.ndarray
-            if np.linalg.norm(np.cross(n, up)) < 0.001:
-                up = np.array([1.0, 0.0, 0.0])
-            camera = SimpleCamera(self.__base_centre, n, up)  # type: SimpleCamera
-
-            # Use it to obtain the matrix that should be used to update OpenGL's model-view matrix.
-            m = np.linalg.inv(CameraPoseConverter.camera_to_pose(camera))  # type: np.ndarray
-
-            # Update OpenGL's model-view matrix and return.
             glMatrixMode(GL_MODELVIEW)
             glPushMatrix()
-            glMultMatrixf(m.flatten(order='F'))
+            glMultMatrixf(self.__m)
             return self
 
         def __exit__(self, exception_type, exception_value, traceback):
@@ -104,19 +219,40 @@ class OpenGLUtil:
     @staticmethod
     def begin_2d() -> None:
         """Set appropriate projection and model-view matrices for 2D rendering."""
+        # Note: The matrices never change, so we load precomputed versions of them rather than building them up.
         glMatrixMode(GL_PROJECTION)
         glPushMatrix()
-        glLoadIdentity()
-        glOrtho(0.0, 1.0, 0.0, 1.0, 0.0, 1.0)
+        glLoadMatrixf(OpenGLUtil.__PROJECTION_MATRIX_2D)
 
         glMatrixMode(GL_MODELVIEW)
         glPushMatrix()
-        glLoadIdentity()
-        glTranslated(0.0, 1.0, 0.0)
-        glScaled(1.0, -1.0, 1.0)
+        glLoadMatrixf(OpenGLUtil.__MODELVIEW_MATRIX_2D)
 
         glDepthMask(False)
 
+    @staticmethod
+    def compute_projection_matrix(intrinsics: Tuple[float, float, float, float], width: int, height: int,
+                                  near_val: float = 0.1, far_val: float = 1000.0) -> np.ndarray:
+        """
+        Compute the OpenGL projection matrix corresponding to a set of camera intrinsics.
+
+        .. note::
+            This is the matrix that set_projection_matrix loads, and can be used (e.g. as a shader uniform) without
+            going through OpenGL's fixed-function matrix stack. The results are cached, so the matrix is read-only.
+
+        :param intrinsics:  The camera intrinsics.
+        :param width:       The width of the viewport.
+        :param height:      The height of the viewport.
+        :param near_val:    The distance to the camera frustum's near plane.
+        :param far_val:     The distance to the camera frustum's far plane.
+        :return:            The projection matrix, as a 4x4 single-precision array.
+        """
+        # Note: The cached matrix is stored in column-major order, so we reshape and transpose it to get a view of it
+        #       whose elements are indexed in the usual way.
+        return OpenGLUtil.__make_projection_matrix(
+            tuple(intrinsics), width, height, near_val, far_val
+        ).reshape(4, 4).T
+
     @staticmethod
     def end_2d() -> None:
         """Restore the projection and model-view matrices that were active prior to 2D rendering."""
@@ -128,6 +264,37 @@ class OpenGLUtil:
         glMatrixMode(GL_PROJECTION)
         glPopMatrix()
 
+    @staticmethod
+    def linearise_depth_image(depth_image: np.ndarray, near_val: float = 0.1, far_val: float = 1000.0) -> np.ndarray:
+        """
+        Convert an image containing raw values from an OpenGL depth buffer into an image containing eye-space depths.
+
+        :param depth_image: The image containing the raw depth buffer values (in the range [0,1]).
+        :param near_val:    The distance to the camera frustum's near plane.
+        :param far_val:     The distance to the camera frustum's far plane.
+        :return:            The image containing the eye-space depths.
+        """
+        # See: https://stackoverflow.com/questions/52036176/pyopengl-get-depth-map-of-drawn-image. Substituting
+        # z_ndc = 2 * d - 1 into z_eye = 2 * n * f / (f + n - z_ndc * (f - n)) and simplifying gives the expression
+        # below. If possible, we evaluate it in a single pass using a compiled kernel; if not, we evaluate it in place
+        # in a single output array to avoid allocating any image-sized temporaries. Either way, the coefficients are
+        # converted to the output type up-front, so that both paths perform exactly the same arithmetic.
+        dtype = np.promote_types(depth_image.dtype, np.float32)  # type: np.dtype
+        numerator = dtype.type(near_val * far_val)
+        scale = dtype.type(near_val - far_val)
+        offset = dtype.type(far_val)
+
+        if numba is not None and depth_image.ndim == 2:
+            z_eye = np.empty(depth_image.shape, dtype=dtype)  # type: np.ndarray
+            _linearise_depth_image_kernel(depth_image, numerator, scale, offset, z_eye)
+            return z_eye
+
+        z_eye = np.multiply(depth_image, scale, dtype=dtype)
+        z_eye += offset
+        np.divide(numerator, z_eye, out=z_eye)
+
+        return z_eye
+
     @staticmethod
     def load_matrix(m: np.ndarray) -> None:
         """
@@ -135,7 +302,7 @@ class OpenGLUtil:
 
         :param m:   The matrix with which to set the currently active OpenGL matrix.
         """
-        glLoadMatrixf(m.flatten(order='F'))
+        glLoadMatrixf(OpenGLUtil.__to_column_major(m))
 
     @staticmethod
     def mult_matrix(m: np.ndarray) -> None:
@@ -144,7 +311,7 @@ class OpenGLUtil:
 
         :param m:   The matrix by which to multiply the currently active OpenGL matrix.
         """
-        glMultMatrixf(m.flatten(order='F'))
+        glMultMatrixf(OpenGLUtil.__to_column_major(m))
 
     @staticmethod
     def read_bgr_image(width: int, height: int) -> np.ndarray:
@@ -155,30 +322,118 @@ class OpenGLUtil:
         :param height:  The screen / frame-buffer height.
         :return:        The BGR image.
         """
-        buffer = glReadPixels(0, 0, width, height, GL_BGR, GL_UNSIGNED_BYTE)  # type: bytes
-        return np.frombuffer(buffer, dtype=np.uint8).reshape((height, width, 3))[::-1, :]
+        # Note: The pixels are read into a reusable scratch buffer, and then flipped into a new (C-contiguous) image,
+        #       since that's what downstream consumers (e.g. OpenCV) typically want anyway. The reading is done by a
+        #       reader specialised for the frame-buffer size, which in practice rarely changes.
+        return OpenGLUtil.__get_bgr_reader(width, height)()
+
+    @staticmethod
+    def read_buffer(target: int, buffer_id: int, size: int) -> np.ndarray:
+        """
+        Read the contents of an OpenGL buffer object into a byte array.
+
+        .. note::
+            If the GPU is still writing to the buffer (e.g. because of an earlier glReadPixels into a pixel pack
+            buffer), this will block until it has finished doing so.
+
+        :param target:      The target to which to bind the buffer (e.g. GL_PIXEL_PACK_BUFFER).
+        :param buffer_id:   The ID of the buffer.
+        :param size:        The number of bytes to read.
+        :return:            A byte array containing a copy of the buffer's contents.
+        """
+        glBindBuffer(target, buffer_id)
+        try:
+            ptr = glMapBufferRange(target, 0, size, GL_MAP_READ_BIT)
+            try:
+                data = ctypes.cast(ptr, ctypes.POINTER(ctypes.c_ubyte * size)).contents
+                return np.frombuffer(data, dtype=np.uint8).copy()
+            finally:
+                glUnmapBuffer(target)
+        finally:
+            glBindBuffer(target, 0)
 
     @staticmethod
-    def read_depth_image(width: int, height: int, near_val: float = 0.1, far_val: float = 1000.0) -> np.ndarray:
+    def read_depth_image(width: int, height: int, near_val: float = 0.1, far_val: float = 1000.0, *,
+                         use_half_precision: bool = False) -> np.ndarray:
         """
         Read the contents of the active depth buffer into a floating-point depth image.
 
-        :param width:       The depth buffer width.
-        :param height:      The depth buffer height.
-        :param near_val:    The distance to the camera frustum's near plane.
-        :param far_val:     The distance to the camera frustum's far plane.
-        :return:            The depth image.
+        .. note::
+            Reading the depth buffer at half precision halves the amount of data that has to be transferred from
+            the GPU. However, since raw depth values are concentrated close to 1, half precision only resolves
+            depths reasonably close to the camera well, so it should only be used if that's all that matters.
+
+        :param width:               The depth buffer width.
+        :param height:              The depth buffer height.
+        :param near_val:            The distance to the camera frustum's near plane.
+        :param far_val:             The distance to the camera frustum's far plane.
+        :param use_half_precision:  Whether to read the depth buffer at half precision.
+        :return:                    The depth image.
         """
-        depth_buffer = glReadPixels(0, 0, width, height, GL_DEPTH_COMPONENT, GL_FLOAT)  # type: bytes
-        depth_image = np.frombuffer(
-            depth_buffer, dtype=np.float32
-        ).reshape((height, width))[::-1, :]  # type: np.ndarray
+        # Note: The raw depths are read into a reusable scratch buffer, since linearising them makes a new image anyway.
+        if use_half_precision:
+            depth_image = OpenGLUtil.__get_readback_buffer("depth16", (height, width), np.float16)  # type: np.ndarray
+            OpenGLUtil.__read_pixels_into(depth_image, GL_DEPTH_COMPONENT, GL_HALF_FLOAT)
+            depth_image = depth_image.astype(np.float32)
+        else:
+            depth_image = OpenGLUtil.__get_readback_buffer("depth32", (height, width), np.float32)
+            OpenGLUtil.__read_pixels_into(depth_image, GL_DEPTH_COMPONENT, GL_FLOAT)
 
-        # See: https://stackoverflow.com/questions/52036176/pyopengl-get-depth-map-of-drawn-image
-        z_ndc = 2.0 * depth_image - 1.0  # type: np.ndarray
-        z_eye = 2.0 * near_val * far_val / (far_val + near_val - z_ndc * (far_val - near_val))  # type: np.ndarray
+        return OpenGLUtil.linearise_depth_image(depth_image[::-1, :], near_val, far_val)
 
-        return z_eye
+    @staticmethod
+    def release_cached_objects() -> None:
+        """
+        Release any OpenGL objects that have been cached for reuse in the current OpenGL context.
+
+        .. note::
+            Some of the rendering functions cache the OpenGL objects they need (e.g. vertex buffer objects) for
+            each context in which they're used. Before destroying an OpenGL context in which any of them have
+            been used, this must be called (with that context current). Otherwise, the cached objects will be
+            leaked, and a context subsequently created with the same handle could be handed their stale names.
+        """
+        cache = OpenGLUtil.__context_caches.pop(contextdata.getContext(), None)  # type: Optional[Dict[str, Any]]
+        if cache is None:
+            return
+
+        buffer_ids = []  # type: List[int]
+        vaos = []        # type: List[int]
+
+        stream_vbo_id = cache.get("stream_vbo_id")  # type: Optional[int]
+        if stream_vbo_id is not None:
+            buffer_ids.append(stream_vbo_id)
+
+        unit_cube = cache.get("unit_cube")  # type: Optional[Tuple[int, int, int]]
+        if unit_cube is not None:
+            vaos.append(unit_cube[0])
+            buffer_ids += unit_cube[1:]
+
+        unit_quad = cache.get("unit_quad")  # type: Optional[Tuple[int, int]]
+        if unit_quad is not None:
+            vaos.append(unit_quad[0])
+            buffer_ids.append(unit_quad[1])
+
+        for ibo_id, _ in cache.get("sphere_index_buffers", {}).values():
+            buffer_ids.append(ibo_id)
+
+        for vao, _, _, vbo_id, ibo_id in cache.get("unit_spheres", {}).values():
+            vaos.append(vao)
+            buffer_ids += [vbo_id, ibo_id]
+
+        for vao, vbo_id, _ in cache.get("voxel_grids", {}).values():
+            vaos.append(vao)
+            buffer_ids.append(vbo_id)
+
+        try:
+            if len(vaos) > 0:
+                glDeleteVertexArrays(len(vaos), vaos)
+            if len(buffer_ids) > 0:
+                glDeleteBuffers(len(buffer_ids), buffer_ids)
+            if cache.get("default_quadric") is not None:
+                gluDeleteQuadric(cache["default_quadric"])
+        except Error:
+            # Note: As elsewhere, failing to delete the objects is fairly harmless, whereas crashing isn't.
+            pass
 
     @staticmethod
     def render_aabb(mins: np.ndarray, maxs: np.ndarray) -> None:
@@ -188,30 +443,18 @@ class OpenGLUtil:
         :param mins:    The minimum bounds of the AABB.
         :param maxs:    The maximum bounds of the AABB.
         """
-        glBegin(GL_LINE_LOOP)
-        glVertex3f(mins[0], mins[1], mins[2])
-        glVertex3f(maxs[0], mins[1], mins[2])
-        glVertex3f(maxs[0], mins[1], maxs[2])
-        glVertex3f(mins[0], mins[1], maxs[2])
-        glEnd()
-
-        glBegin(GL_LINE_LOOP)
-        glVertex3f(mins[0], maxs[1], mins[2])
-        glVertex3f(maxs[0], maxs[1], mins[2])
-        glVertex3f(maxs[0], maxs[1], maxs[2])
-        glVertex3f(mins[0], maxs[1], maxs[2])
-        glEnd()
-
-        glBegin(GL_LINES)
-        glVertex3f(mins[0], mins[1], mins[2])
-        glVertex3f(mins[0], maxs[1], mins[2])
-        glVertex3f(maxs[0], mins[1], mins[2])
-        glVertex3f(maxs[0], maxs[1], mins[2])
-        glVertex3f(maxs[0], mins[1], maxs[2])
-        glVertex3f(maxs[0], maxs[1], maxs[2])
-        glVertex3f(mins[0], mins[1], maxs[2])
-        glVertex3f(mins[0], maxs[1], maxs[2])
-        glEnd()
+        # Note: Every AABB has the same topology, so we render a unit cube whose edges were uploaded to the GPU once
+        #       and for all, transformed to span the AABB, rather than streaming the edges of each AABB separately.
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glTranslatef(*mins)
+        glScalef(*(np.asarray(maxs) - np.asarray(mins)))
+
+        glBindVertexArray(OpenGLUtil.__get_unit_cube())
+        raw_glDrawElements(GL_LINES, 24, GL_UNSIGNED_BYTE, None)
+        glBindVertexArray(0)
+
+        glPopMatrix()
 
     @staticmethod
     def render_cylinder(base_centre: np.ndarray, top_centre: np.ndarray, base_radius: float, top_radius: float,
@@ -226,22 +469,104 @@ class OpenGLUtil:
         :param slices:          The number of subdivisions of the cylinder around its length.
         :param stacks:          The number of subdivisions of the cylinder along its length.
         :param quadric:         An optional GLU quadric to use when rendering the cylinder (if none is specified,
-                                one will be created on the fly).
+                                a shared default one will be used).
         """
         axis = top_centre - base_centre   # type: np.ndarray
         axis_norm = np.linalg.norm(axis)  # type: float
         if axis_norm < 0.001:
             return
 
-        with OpenGLUtil.GLUQuadricWrapper(quadric) as quadric_wrapper:
-            with OpenGLUtil.OrientedCylinderContext(base_centre, axis):
-                gluCylinder(
-                    quadric_wrapper.get_quadric(), base_radius, top_radius, axis_norm, slices, stacks
-                )
-                gluDisk(quadric_wrapper.get_quadric(), 0.0, base_radius, slices, 1)
-                glTranslatef(0.0, 0.0, axis_norm)
-                gluDisk(quadric_wrapper.get_quadric(), 0.0, top_radius, slices, 1)
-                glTranslatef(0.0, 0.0, -axis_norm)
+        if quadric is None:
+            quadric = OpenGLUtil.__get_default_quadric()
+
+        with OpenGLUtil.OrientedCylinderContext(base_centre, axis):
+            OpenGLUtil.__draw_capped_cylinder(quadric, base_radius, top_radius, axis_norm, slices, stacks)
+
+    @staticmethod
+    def render_cylinders(base_centres: List[np.ndarray], top_centres: List[np.ndarray], base_radii: List[float],
+                         top_radii: List[float], slices: int, stacks: int = 1,
+                         quadric: Optional[GLUquadric] = None) -> None:
+        """
+        Render a set of cylinders, each between the specified base centre and top centre points.
+
+        .. note::
+            This is equivalent to calling render_cylinder for each cylinder in turn, but avoids redundant state
+            changes by setting the matrix mode and looking up the quadric only once for the whole set.
+
+        :param base_centres:    The centres of the bases of the cylinders.
+        :param top_centres:     The centres of the tops of the cylinders.
+        :param base_radii:      The radii of the bases of the cylinders.
+        :param top_radii:       The radii of the tops of the cylinders.
+        :param slices:          The number of subdivisions of each cylinder around its length.
+        :param stacks:          The number of subdivisions of each cylinder along its length.
+        :param quadric:         An optional GLU quadric to use when rendering the cylinders (if none is specified,
+                                a shared default one will be used).
+        """
+        if quadric is None:
+            quadric = OpenGLUtil.__get_default_quadric()
+
+        glMatrixMode(GL_MODELVIEW)
+
+        for base_centre, top_centre, base_radius, top_radius in zip(base_centres, top_centres, base_radii, top_radii):
+            axis = top_centre - base_centre   # type: np.ndarray
+            axis_norm = np.linalg.norm(axis)  # type: float
+            if axis_norm < 0.001:
+                continue
+
+            glPushMatrix()
+            glMultMatrixf(_make_oriented_cylinder_matrix(*base_centre, *axis))
+            OpenGLUtil.__draw_capped_cylinder(quadric, base_radius, top_radius, axis_norm, slices, stacks)
+            glPopMatrix()
+
+    @staticmethod
+    def render_lines(vertices: np.ndarray, mode: int = GL_LINES, *, colours: Optional[np.ndarray] = None) -> None:
+        """
+        Render a set of lines using a single draw call.
+
+        .. note::
+            The vertices (and colours, if specified) are streamed to the GPU via a vertex buffer object that's
+            reused from one call to the next, which is much cheaper than specifying them one at a time.
+
+        :param vertices:    The vertices of the lines, as an n*3 array.
+        :param mode:        The OpenGL primitive type to use (e.g. GL_LINES, GL_LINE_STRIP or GL_LINE_LOOP).
+        :param colours:     The colours of the vertices, as an n*3 array (optional). If these aren't specified, the
+                            lines will be rendered in the current colour.
+        """
+        vertex_count = len(vertices)  # type: int
+        if vertex_count == 0:
+            return
+
+        # Pack the vertices (and colours, if specified) into a single array, interleaved. If there are no colours
+        # and the vertices are already in the right format, they can be uploaded as they are.
+        if colours is None and vertices.dtype == np.float32 and vertices.flags["C_CONTIGUOUS"]:
+            data = vertices  # type: np.ndarray
+        else:
+            data = np.empty((vertex_count, 3 if colours is None else 6), dtype=np.float32)
+            data[:, 0:3] = vertices
+            if colours is not None:
+                data[:, 3:6] = colours
+
+        # Upload the data and render the lines. Note that if per-vertex colours are used, the current colour is
+        # left undefined afterwards, so we save and restore it.
+        if colours is not None:
+            glPushAttrib(GL_CURRENT_BIT)
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+
+        glBindBuffer(GL_ARRAY_BUFFER, OpenGLUtil.__get_stream_vbo_id())
+        raw_glBufferData(GL_ARRAY_BUFFER, data.nbytes, data.ctypes.data_as(ctypes.c_void_p), GL_STREAM_DRAW)
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, data.strides[0], ctypes.c_void_p(0))
+        if colours is not None:
+            glEnableClientState(GL_COLOR_ARRAY)
+            glColorPointer(3, GL_FLOAT, data.strides[0], ctypes.c_void_p(12))
+
+        raw_glDrawArrays(mode, 0, vertex_count)
+
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glPopClientAttrib()
+        if colours is not None:
+            glPopAttrib()
 
     @staticmethod
     def render_sphere(centre: np.ndarray, radius: float, *,
@@ -253,32 +578,131 @@ class OpenGLUtil:
         :param radius:      The radius of the sphere.
         :param slices:      The number of subdivisions of the sphere around its vertical axis.
         :param stacks:      The number of subdivisions of the sphere along its vertical axis.
-        :param quadric:     An optional GLU quadric to use when rendering the sphere (if none is specified,
-                            one will be created on the fly).
+        :param quadric:     An optional GLU quadric to use when rendering the sphere (if none is specified, the
+                            sphere will be rendered using a cached, pre-tessellated unit sphere).
         """
-        with OpenGLUtil.GLUQuadricWrapper(quadric) as quadric_wrapper:
-            glMatrixMode(GL_MODELVIEW)
-            glPushMatrix()
-            glTranslatef(*centre)
-            gluSphere(quadric_wrapper.get_quadric(), radius, slices, stacks)
-            glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glTranslatef(*centre)
+
+        if quadric is not None:
+            gluSphere(quadric, radius, slices, stacks)
+        else:
+            # Note: Rendering a scaled copy of a unit sphere that was tessellated once and for all is much cheaper
+            #       than having GLU tessellate and submit the sphere afresh every time. Since the scaling also scales
+            #       the sphere's normals, we make OpenGL rescale them back to unit length.
+            vao, index_count, index_type = OpenGLUtil.__get_unit_sphere(slices, stacks)
+            glScalef(radius, radius, radius)
+            glPushAttrib(GL_ENABLE_BIT)
+            glEnable(GL_RESCALE_NORMAL)
+            glBindVertexArray(vao)
+            raw_glDrawElements(GL_TRIANGLES, index_count, index_type, None)
+            glBindVertexArray(0)
+            glPopAttrib()
+
+        glPopMatrix()
 
     @staticmethod
-    def render_trajectory(trajectory: List[Tuple[float, np.ndarray]], *, colour: Tuple[float, float, float]) -> None:
+    def render_spheres(centres: np.ndarray, radii: np.ndarray, *, slices: int, stacks: int) -> None:
+        """
+        Render a set of spheres using a single draw call.
+
+        .. note::
+            The spheres are all made by scaling and translating a cached, pre-tessellated unit sphere on the CPU,
+            and the results are streamed to the GPU together. This is much cheaper than rendering the spheres one
+            at a time (e.g. via render_sphere) when there are lots of them. (True instancing isn't an option, since
+            the rest of the rendering uses the fixed-function pipeline.) To keep the per-call cost down, the vertex
+            data is built in a reusable scratch buffer, and the indices are uploaded once and then reused.
+
+        :param centres: The positions of the centres of the spheres, as an n*3 array.
+        :param radii:   The radii of the spheres, as an array of length n (or a single radius for all of them).
+        :param slices:  The number of subdivisions of each sphere around its vertical axis.
+        :param stacks:  The number of subdivisions of each sphere along its vertical axis.
+        """
+        sphere_count = len(centres)  # type: int
+        if sphere_count == 0:
+            return
+
+        unit_vertices, unit_indices = OpenGLUtil.__make_unit_sphere(slices, stacks)
+        vertex_count = len(unit_vertices)  # type: int
+
+        # Make the vertices and normals of all of the spheres, interleaved, in a reusable scratch buffer (which is
+        # only reallocated if it's too small).
+        size = sphere_count * vertex_count * 6  # type: int
+        scratch = getattr(OpenGLUtil.__thread_local, "sphere_vertices", None)  # type: Optional[np.ndarray]
+        if scratch is None or len(scratch) < size:
+            scratch = OpenGLUtil.__thread_local.sphere_vertices = np.empty(size, dtype=np.float32)
+
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.float32), (sphere_count,))  # type: np.ndarray
+        data = scratch[:size].reshape((sphere_count, vertex_count, 6))                  # type: np.ndarray
+        data[:, :, 0:3] = unit_vertices
+        data[:, :, 0:3] *= radii[:, np.newaxis, np.newaxis]
+        data[:, :, 0:3] += np.asarray(centres, dtype=np.float32)[:, np.newaxis, :]
+        data[:, :, 3:6] = unit_vertices
+
+        # Upload the vertices and normals, and render the spheres using the cached index buffer. Note that we make
+        # sure no vertex array object is bound first, both so that we don't modify one by mistake, and so that the
+        # index buffer binding below is the one that will actually be used.
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glBindVertexArray(0)
+
+        glBindBuffer(GL_ARRAY_BUFFER, OpenGLUtil.__get_stream_vbo_id())
+        raw_glBufferData(GL_ARRAY_BUFFER, data.nbytes, data.ctypes.data_as(ctypes.c_void_p), GL_STREAM_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, OpenGLUtil.__get_sphere_index_buffer(slices, stacks, sphere_count))
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 24, ctypes.c_void_p(0))
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glNormalPointer(GL_FLOAT, 24, ctypes.c_void_p(12))
+
+        raw_glDrawElements(GL_TRIANGLES, sphere_count * len(unit_indices), GL_UNSIGNED_INT, None)
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glPopClientAttrib()
+
+    @staticmethod
+    def render_textured_quad() -> None:
+        """
+        Render the unit quad [0,1]^2 (in the z = 0 plane), textured with the currently bound 2D texture.
+
+        .. note::
+            The quad's positions double as its texture coordinates, so (0,0) and (1,1) are mapped to (0,0) and
+            (1,1) in the texture, respectively. It's rendered as a triangle strip from a vertex array object that's
+            built once (per thread) and then reused.
+        .. note::
+            This doesn't enable texturing or bind a texture itself. That's left to the caller (e.g. by using an
+            OpenGLTextureContext), so that when lots of quads are rendered, the state only needs to be set once.
+        """
+        glBindVertexArray(OpenGLUtil.__get_unit_quad())
+        raw_glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        glBindVertexArray(0)
+
+    @staticmethod
+    def render_trajectory(trajectory: Union[List[Tuple[float, np.ndarray]], np.ndarray], *,
+                          colour: Tuple[float, float, float]) -> None:
         """
         Render the line segments needed to visualise a trajectory.
 
+        .. note::
+            The trajectory can either be a list of (timestamp, pose) pairs, or an n*4*4 array of poses. If the
+            poses are already in an array, their positions can be extracted without any Python-level looping.
+
         :param trajectory:  The trajectory to visualise.
         :param colour:      The colour to use for the line segments.
         """
         if len(trajectory) < 2:
             return
 
+        # Note: The positions are gathered straight into a single-precision array, which render_lines can upload
+        #       without copying it again.
+        if isinstance(trajectory, np.ndarray):
+            positions = np.ascontiguousarray(trajectory[:, 0:3, 3], dtype=np.float32)  # type: np.ndarray
+        else:
+            positions = np.array([pose[0:3, 3] for _, pose in trajectory], dtype=np.float32)
+
         glColor3f(*colour)
-        glBegin(GL_LINE_STRIP)
-        for _, pose in trajectory:
-            glVertex3f(*pose[0:3, 3])
-        glEnd()
+        OpenGLUtil.render_lines(positions, GL_LINE_STRIP)
 
     @staticmethod
     def render_voxel_grid(mins: List[float], maxs: List[float], voxel_size: List[float], *,
@@ -291,18 +715,18 @@ class OpenGLUtil:
         :param voxel_size:  The voxel size.
         :param dotted:      Whether to use dotted lines for the voxel grid.
         """
-        pts1, pts2 = GeometryUtil.make_voxel_grid_endpoints(mins, maxs, voxel_size)
+        # Note: In practice, the same voxel grid tends to be rendered every frame, so we look up its lines in a
+        #       small cache of grids whose lines have already been uploaded to the GPU.
+        vao, vertex_count = OpenGLUtil.__get_voxel_grid(tuple(mins), tuple(maxs), tuple(voxel_size))
 
         if dotted:
             glPushAttrib(GL_ENABLE_BIT)
             glLineStipple(1, 0x8888)
             glEnable(GL_LINE_STIPPLE)
 
-        glBegin(GL_LINES)
-        for i in range(len(pts1)):
-            glVertex3f(*pts1[i])
-            glVertex3f(*pts2[i])
-        glEnd()
+        glBindVertexArray(vao)
+        raw_glDrawArrays(GL_LINES, 0, vertex_count)
+        glBindVertexArray(0)
 
         if dotted:
             glPopAttrib()
@@ -316,19 +740,9 @@ class OpenGLUtil:
         :param width:       The width of the viewport.
         :param height:      The height of the viewport.
         """
-        near_val = 0.1    # type: float
-        far_val = 1000.0  # type: float
-
-        # To rederive these equations, use similar triangles. Note that fx = f / sx and fy = f / sy,
-        # where sx and sy are the dimensions of a pixel on the image plane.
-        fx, fy, cx, cy = intrinsics
-        left_val = -cx * near_val / fx            # type: float
-        right_val = (width - cx) * near_val / fx  # type: float
-        bottom_val = -cy * near_val / fy          # type: float
-        top_val = (height - cy) * near_val / fy   # type: float
-
-        glLoadIdentity()
-        glFrustum(left_val, right_val, bottom_val, top_val, near_val, far_val)
+        # Note: In practice, the intrinsics and viewport size tend to stay the same from one frame to the next, so
+        #       we look up the projection matrix in a small cache rather than recomputing it every time.
+        glLoadMatrixf(OpenGLUtil.__make_projection_matrix(tuple(intrinsics), width, height))
 
     @staticmethod
     def set_viewport(top_left: Tuple[float, float], bottom_right: Tuple[float, float],
@@ -344,10 +758,508 @@ class OpenGLUtil:
         :param bottom_right:    An (x,y) tuple denoting the bottom-right of the viewport to set.
         :param window_size:     The window size.
         """
-        left = int(np.round(top_left[0] * window_size[0]))              # type: int
-        top = int(np.round((1.0 - bottom_right[1]) * window_size[1]))   # type: int
+        # Note: The built-in round rounds halves to even, just like np.round, but avoids going via numpy. (The int
+        #       calls are still needed in case the coordinates are numpy scalars, which some versions of numpy round
+        #       to floats.)
+        left = int(round(top_left[0] * window_size[0]))                 # type: int
+        top = int(round((1.0 - bottom_right[1]) * window_size[1]))      # type: int
         width = int((bottom_right[0] - top_left[0]) * window_size[0])   # type: int
         height = int((bottom_right[1] - top_left[1]) * window_size[1])  # type: int
         glViewport(left, top, width, height)
         glScissor(left, top, width, height)
         glEnable(GL_SCISSOR_TEST)
+
+    # PRIVATE STATIC METHODS
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def __make_projection_matrix(intrinsics: Tuple[float, float, float, float], width: int, height: int,
+                                 near_val: float = 0.1, far_val: float = 1000.0) -> np.ndarray:
+        """
+        Make an OpenGL projection matrix based on a set of camera intrinsics.
+
+        .. note::
+            The matrix is the one that glFrustum would produce for the frustum corresponding to the intrinsics and
+            viewport size. It's returned in the column-major, single-precision form that glLoadMatrixf expects,
+            and since the results are cached, it's made read-only.
+
+        :param intrinsics:  The camera intrinsics.
+        :param width:       The width of the viewport.
+        :param height:      The height of the viewport.
+        :param near_val:    The distance to the camera frustum's near plane.
+        :param far_val:     The distance to the camera frustum's far plane.
+        :return:            The projection matrix.
+        """
+        # Note: If the frustum is expressed in terms of the intrinsics (e.g. right - left = width * near / fx, as can
+        #       be seen using similar triangles), the near distance cancels out of the x and y terms of the matrix,
+        #       so we can compute them directly from the intrinsics. See also the matrix in the documentation for
+        #       glFrustum: https://www.khronos.org/registry/OpenGL-Refpages/gl2.1/xhtml/glFrustum.xml.
+        fx, fy, cx, cy = intrinsics
+
+        # Note: The matrix is filled in transposed, so that its elements end up in column-major order.
+        m = np.zeros((4, 4), dtype=np.float32)  # type: np.ndarray
+        m[0, 0] = 2 * fx / width
+        m[2, 0] = 1 - 2 * cx / width
+        m[1, 1] = 2 * fy / height
+        m[2, 1] = 1 - 2 * cy / height
+        m[2, 2] = -(far_val + near_val) / (far_val - near_val)
+        m[3, 2] = -2 * far_val * near_val / (far_val - near_val)
+        m[2, 3] = -1.0
+
+        m = m.reshape(16)
+        m.flags.writeable = False
+        return m
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def __make_unit_sphere(slices: int, stacks: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tessellate a unit sphere, centred at the origin.
+
+        .. note::
+            Like a GLU sphere, the sphere is divided into stacks along the z axis, and into slices around it.
+        .. note::
+            The arrays returned are cached, and so are made read-only to stop them being modified by mistake.
+
+        :param slices:  The number of subdivisions of the sphere around its vertical axis.
+        :param stacks:  The number of subdivisions of the sphere along its vertical axis.
+        :return:        A tuple consisting of the sphere's vertices (which are also its normals, since it's a unit
+                        sphere), as an n*3 float32 array, and the vertex indices of its triangles, as a uint32 array.
+        """
+        # Compute the vertices of the sphere.
+        phi, theta = np.meshgrid(
+            np.linspace(0.0, np.pi, stacks + 1), np.linspace(0.0, 2 * np.pi, slices + 1), indexing="ij"
+        )
+        vertices = np.stack([
+            np.sin(phi) * np.cos(theta), np.sin(phi) * np.sin(theta), np.cos(phi)
+        ], axis=-1).reshape(-1, 3).astype(np.float32)  # type: np.ndarray
+
+        # Compute the triangles of the sphere, two per stack/slice cell (wound anti-clockwise when seen from outside).
+        i, j = np.meshgrid(np.arange(stacks), np.arange(slices), indexing="ij")
+        a = i * (slices + 1) + j  # type: np.ndarray
+        b = a + (slices + 1)      # type: np.ndarray
+        indices = np.stack([a, b, b + 1, a, b + 1, a + 1], axis=-1).reshape(-1).astype(np.uint32)  # type: np.ndarray
+
+        vertices.flags.writeable = False
+        indices.flags.writeable = False
+        return vertices, indices
+
+    @staticmethod
+    def __draw_capped_cylinder(quadric: GLUquadric, base_radius: float, top_radius: float, height: float,
+                               slices: int, stacks: int) -> None:
+        """
+        Draw a GLU cylinder, capped with disks at both ends, along the z axis from z = 0 to z = height.
+
+        :param quadric:     The GLU quadric to use when drawing the cylinder.
+        :param base_radius: The radius of the base of the cylinder.
+        :param top_radius:  The radius of the top of the cylinder.
+        :param height:      The height of the cylinder.
+        :param slices:      The number of subdivisions of the cylinder around its length.
+        :param stacks:      The number of subdivisions of the cylinder along its length.
+        """
+        gluCylinder(quadric, base_radius, top_radius, height, slices, stacks)
+        gluDisk(quadric, 0.0, base_radius, slices, 1)
+        glTranslatef(0.0, 0.0, height)
+        gluDisk(quadric, 0.0, top_radius, slices, 1)
+        glTranslatef(0.0, 0.0, -height)
+
+    @staticmethod
+    def __get_bgr_reader(width: int, height: int) -> Callable[[], np.ndarray]:
+        """
+        Get a function that reads the contents of a frame buffer of the specified size into a BGR image.
+
+        .. note::
+            The reader captures its scratch buffer, a pointer to it and a flipped view of it, so that none of these
+            have to be looked up or recomputed each time it's called. Readers are created the first time they're
+            needed (on each thread), and then reused. To keep memory usage bounded, only a few are kept at a time.
+
+        :param width:   The frame-buffer width.
+        :param height:  The frame-buffer height.
+        :return:        The reader.
+        """
+        readers = getattr(
+            OpenGLUtil.__thread_local, "bgr_readers", None
+        )  # type: Optional[Dict[Tuple[int, int], Callable[[], np.ndarray]]]
+        if readers is None:
+            readers = OpenGLUtil.__thread_local.bgr_readers = {}
+
+        reader = readers.get((width, height))  # type: Optional[Callable[[], np.ndarray]]
+        if reader is not None:
+            return reader
+
+        image = np.empty((height, width, 3), dtype=np.uint8)  # type: np.ndarray
+        ptr = image.ctypes.data_as(ctypes.c_void_p)           # type: ctypes.c_void_p
+        flipped_image = image[::-1, :]                        # type: np.ndarray
+
+        def read() -> np.ndarray:
+            glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+            glPixelStorei(GL_PACK_ALIGNMENT, 1)
+            raw_glReadPixels(0, 0, width, height, GL_BGR, GL_UNSIGNED_BYTE, ptr)
+            glPopClientAttrib()
+            return np.ascontiguousarray(flipped_image)
+
+        if len(readers) >= 8:
+            readers.clear()
+
+        reader = readers[(width, height)] = read
+        return reader
+
+    @staticmethod
+    def __get_context_cache() -> Dict[str, Any]:
+        """
+        Get the cache of reusable OpenGL objects for the current OpenGL context.
+
+        :return:    The cache of reusable OpenGL objects for the current OpenGL context.
+        """
+        context = contextdata.getContext()
+        cache = OpenGLUtil.__context_caches.get(context)  # type: Optional[Dict[str, Any]]
+        if cache is None:
+            cache = OpenGLUtil.__context_caches[context] = {}
+        return cache
+
+    @staticmethod
+    def __get_default_quadric() -> GLUquadric:
+        """
+        Get the GLU quadric to use for rendering when the caller hasn't specified one.
+
+        .. note::
+            The quadric is created the first time it's needed (in each OpenGL context), and then reused, which
+            avoids creating and destroying a quadric for every shape rendered.
+
+        :return:    The default GLU quadric.
+        """
+        cache = OpenGLUtil.__get_context_cache()  # type: Dict[str, Any]
+        quadric = cache.get("default_quadric")    # type: Optional[GLUquadric]
+        if quadric is None:
+            quadric = cache["default_quadric"] = gluNewQuadric()
+        return quadric
+
+    @staticmethod
+    def __get_readback_buffer(name: str, shape: Tuple[int, ...], dtype: type) -> np.ndarray:
+        """
+        Get a reusable scratch buffer of the specified shape and dtype into which to read pixels back from the GPU.
+
+        .. note::
+            Only one buffer is kept for each name, so if the shape or dtype requested changes, the buffer will be
+            reallocated. The buffer's contents will be overwritten by the next call on the same thread.
+
+        :param name:    The name of the buffer (e.g. "depth32").
+        :param shape:   The shape of the buffer.
+        :param dtype:   The dtype of the buffer.
+        :return:        The buffer.
+        """
+        buffers = getattr(OpenGLUtil.__thread_local, "readback_buffers", None)  # type: Optional[Dict[str, np.ndarray]]
+        if buffers is None:
+            buffers = OpenGLUtil.__thread_local.readback_buffers = {}
+
+        buffer = buffers.get(name)  # type: Optional[np.ndarray]
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = buffers[name] = np.empty(shape, dtype=dtype)
+
+        return buffer
+
+    @staticmethod
+    def __get_sphere_index_buffer(slices: int, stacks: int, sphere_count: int) -> int:
+        """
+        Get an index buffer containing the vertex indices of the triangles of (at least) the specified number of
+        spheres, for use by render_spheres.
+
+        .. note::
+            The indices of the i'th sphere's triangles are those of the unit sphere's triangles, offset by i times
+            the number of vertices in the unit sphere. Since the indices for fewer spheres are thus a prefix of the
+            indices for more, a single buffer for each tessellation can be reused for any smaller number of spheres.
+            The buffer is created the first time it's needed (in each OpenGL context), and then reused, growing it
+            (by at least a factor of two) whenever more spheres are needed than it can accommodate.
+
+        :param slices:          The number of subdivisions of each sphere around its vertical axis.
+        :param stacks:          The number of subdivisions of each sphere along its vertical axis.
+        :param sphere_count:    The number of spheres that need to be rendered.
+        :return:                The ID of the index buffer (whose indices have type GL_UNSIGNED_INT).
+        """
+        buffers = OpenGLUtil.__get_context_cache().setdefault(
+            "sphere_index_buffers", {}
+        )  # type: Dict[Tuple[int, int], Tuple[int, int]]
+
+        ibo_id, capacity = buffers.get((slices, stacks), (None, 0))  # type: Optional[int], int
+        if sphere_count <= capacity:
+            return ibo_id
+
+        if ibo_id is None:
+            ibo_id = int(glGenBuffers(1))
+        capacity = max(sphere_count, 2 * capacity)
+
+        # Make the vertex indices of the triangles of all of the spheres, offset to refer to the right vertices.
+        unit_vertices, unit_indices = OpenGLUtil.__make_unit_sphere(slices, stacks)
+        offsets = np.arange(0, capacity * len(unit_vertices), len(unit_vertices), dtype=np.uint32)  # type: np.ndarray
+        indices = (unit_indices[np.newaxis, :] + offsets[:, np.newaxis]).reshape(-1)               # type: np.ndarray
+
+        # Upload the indices to the GPU. Note that the caller is responsible for making sure that no vertex array
+        # object is bound (since otherwise, binding the buffer here would modify it).
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ibo_id)
+        raw_glBufferData(
+            GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices.ctypes.data_as(ctypes.c_void_p), GL_STATIC_DRAW
+        )
+
+        buffers[(slices, stacks)] = (ibo_id, capacity)
+        return ibo_id
+
+    @staticmethod
+    def __get_stream_vbo_id() -> int:
+        """
+        Get the ID of the vertex buffer object to use for streaming transient vertex data to the GPU.
+
+        .. note::
+            The buffer is created the first time it's needed (in each OpenGL context), and then reused. Its
+            contents are respecified (with GL_STREAM_DRAW) by each call that uses it.
+
+        :return:    The ID of the vertex buffer object.
+        """
+        cache = OpenGLUtil.__get_context_cache()  # type: Dict[str, Any]
+        vbo_id = cache.get("stream_vbo_id")       # type: Optional[int]
+        if vbo_id is None:
+            vbo_id = cache["stream_vbo_id"] = int(glGenBuffers(1))
+        return vbo_id
+
+    @staticmethod
+    def __get_unit_cube() -> int:
+        """
+        Get a vertex array object that can be used to render the 12 edges of the unit cube [0,1]^3 as lines.
+
+        .. note::
+            The cube is uploaded to the GPU the first time it's needed (in each OpenGL context), and then reused.
+            Its edges should be rendered using glDrawElements(GL_LINES, 24, GL_UNSIGNED_BYTE, None).
+
+        :return:    The ID of the vertex array object.
+        """
+        cache = OpenGLUtil.__get_context_cache()  # type: Dict[str, Any]
+        cube = cache.get("unit_cube")             # type: Optional[Tuple[int, int, int]]
+        if cube is not None:
+            return cube[0]
+
+        # The i'th corner of the cube is at (i & 1, (i >> 1) & 1, (i >> 2) & 1).
+        corners = np.array([
+            [i & 1, (i >> 1) & 1, (i >> 2) & 1] for i in range(8)
+        ], dtype=np.float32)  # type: np.ndarray
+        indices = np.array([
+            # The edges of the bottom face.
+            0, 1, 1, 5, 5, 4, 4, 0,
+            # The edges of the top face.
+            2, 3, 3, 7, 7, 6, 6, 2,
+            # The edges joining the two faces.
+            0, 2, 1, 3, 5, 7, 4, 6
+        ], dtype=np.uint8)  # type: np.ndarray
+
+        # Upload the cube to the GPU, recording the bindings and vertex layout in a vertex array object.
+        vbo_id, ibo_id = [int(k) for k in glGenBuffers(2)]
+        vao = int(glGenVertexArrays(1))  # type: int
+        cache["unit_cube"] = (vao, vbo_id, ibo_id)
+        glBindVertexArray(vao)
+
+        glBindBuffer(GL_ARRAY_BUFFER, vbo_id)
+        raw_glBufferData(GL_ARRAY_BUFFER, corners.nbytes, corners.ctypes.data_as(ctypes.c_void_p), GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ibo_id)
+        raw_glBufferData(
+            GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices.ctypes.data_as(ctypes.c_void_p), GL_STATIC_DRAW
+        )
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, ctypes.c_void_p(0))
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        return vao
+
+    @staticmethod
+    def __get_unit_quad() -> int:
+        """
+        Get a vertex array object that can be used to render the unit quad [0,1]^2 as a textured triangle strip.
+
+        .. note::
+            The quad is uploaded to the GPU the first time it's needed (in each OpenGL context), and then reused.
+
+        :return:    The ID of the vertex array object.
+        """
+        cache = OpenGLUtil.__get_context_cache()  # type: Dict[str, Any]
+        quad = cache.get("unit_quad")             # type: Optional[Tuple[int, int]]
+        if quad is not None:
+            return quad[0]
+
+        # The positions and texture coordinates of the quad's vertices (interleaved).
+        vertices = np.array([
+            [0.0, 0.0, 0.0, 0.0],
+            [1.0, 0.0, 1.0, 0.0],
+            [0.0, 1.0, 0.0, 1.0],
+            [1.0, 1.0, 1.0, 1.0]
+        ], dtype=np.float32)  # type: np.ndarray
+
+        # Upload the quad to the GPU, recording the binding and vertex layout in a vertex array object.
+        vbo_id = int(glGenBuffers(1))    # type: int
+        vao = int(glGenVertexArrays(1))  # type: int
+        cache["unit_quad"] = (vao, vbo_id)
+        glBindVertexArray(vao)
+
+        glBindBuffer(GL_ARRAY_BUFFER, vbo_id)
+        raw_glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices.ctypes.data_as(ctypes.c_void_p), GL_STATIC_DRAW)
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 16, ctypes.c_void_p(0))
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glTexCoordPointer(2, GL_FLOAT, 16, ctypes.c_void_p(8))
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        return vao
+
+    @staticmethod
+    def __get_unit_sphere(slices: int, stacks: int) -> Tuple[int, int, int]:
+        """
+        Get a pre-tessellated unit sphere, centred at the origin, that can be used to render spheres efficiently.
+
+        .. note::
+            The sphere is tessellated and uploaded to the GPU the first time it's needed (in each OpenGL context),
+            and then reused. Like a GLU sphere, it's divided into stacks along the z axis, and into slices around it.
+
+        :param slices:  The number of subdivisions of the sphere around its vertical axis.
+        :param stacks:  The number of subdivisions of the sphere along its vertical axis.
+        :return:        A tuple consisting of the ID of a vertex array object that can be used to render the sphere,
+                        the number of indices to render, and the OpenGL type of the indices.
+        """
+        spheres = OpenGLUtil.__get_context_cache().setdefault(
+            "unit_spheres", {}
+        )  # type: Dict[Tuple[int, int], Tuple[int, int, int, int, int]]
+
+        sphere = spheres.get((slices, stacks))  # type: Optional[Tuple[int, int, int, int, int]]
+        if sphere is not None:
+            return sphere[:3]
+
+        vertices, indices = OpenGLUtil.__make_unit_sphere(slices, stacks)
+        if len(vertices) <= 0x10000:
+            indices, index_type = indices.astype(np.uint16), GL_UNSIGNED_SHORT
+        else:
+            indices, index_type = indices.astype(np.uint32), GL_UNSIGNED_INT
+
+        # Upload the sphere to the GPU, recording the bindings and vertex layout in a vertex array object.
+        vbo_id, ibo_id = [int(k) for k in glGenBuffers(2)]
+        vao = int(glGenVertexArrays(1))  # type: int
+        glBindVertexArray(vao)
+
+        glBindBuffer(GL_ARRAY_BUFFER, vbo_id)
+        raw_glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices.ctypes.data_as(ctypes.c_void_p), GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ibo_id)
+        raw_glBufferData(
+            GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices.ctypes.data_as(ctypes.c_void_p), GL_STATIC_DRAW
+        )
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, ctypes.c_void_p(0))
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glNormalPointer(GL_FLOAT, 0, ctypes.c_void_p(0))
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        spheres[(slices, stacks)] = (vao, len(indices), index_type, vbo_id, ibo_id)
+        return vao, len(indices), index_type
+
+    @staticmethod
+    def __get_voxel_grid(mins: Tuple[float, ...], maxs: Tuple[float, ...], voxel_size: Tuple[float, ...]) \
+            -> Tuple[int, int]:
+        """
+        Get a vertex array object that can be used to render the lines of a wireframe voxel grid.
+
+        .. note::
+            The grid's lines are uploaded to the GPU the first time they're needed (in each OpenGL context), and
+            then reused. To keep GPU memory usage bounded, only a few grids are kept at a time.
+
+        :param mins:        The minimum bounds of the voxel grid.
+        :param maxs:        The maximum bounds of the voxel grid.
+        :param voxel_size:  The voxel size.
+        :return:            A tuple consisting of the ID of a vertex array object that can be used to render the
+                            grid's lines (with GL_LINES), and the number of vertices to render.
+        """
+        grids = OpenGLUtil.__get_context_cache().setdefault(
+            "voxel_grids", {}
+        )  # type: Dict[Tuple[Tuple[float, ...], ...], Tuple[int, int, int]]
+
+        key = (mins, maxs, voxel_size)  # type: Tuple[Tuple[float, ...], ...]
+        grid = grids.get(key)           # type: Optional[Tuple[int, int, int]]
+        if grid is not None:
+            return grid[0], grid[2]
+
+        # If the cache is full, clear it out, deleting the buffers of the grids it contains.
+        if len(grids) >= 8:
+            for vao, vbo_id, _ in grids.values():
+                try:
+                    glDeleteVertexArrays(1, [vao])
+                    glDeleteBuffers(1, [vbo_id])
+                except Error:
+                    pass
+            grids.clear()
+
+        # Compute the grid's lines. The endpoints are interleaved so that each consecutive pair of vertices forms
+        # a line, and are written straight into a single-precision array that can be uploaded as it is.
+        pts1, pts2 = GeometryUtil.make_voxel_grid_endpoints(list(mins), list(maxs), list(voxel_size))
+        vertices = np.empty((2 * len(pts1), 3), dtype=np.float32)  # type: np.ndarray
+        vertices[0::2] = pts1
+        vertices[1::2] = pts2
+
+        # Upload the lines to the GPU, recording the binding and vertex layout in a vertex array object.
+        vbo_id = int(glGenBuffers(1))    # type: int
+        vao = int(glGenVertexArrays(1))  # type: int
+        glBindVertexArray(vao)
+
+        glBindBuffer(GL_ARRAY_BUFFER, vbo_id)
+        raw_glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices.ctypes.data_as(ctypes.c_void_p), GL_STATIC_DRAW)
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, ctypes.c_void_p(0))
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        grids[key] = (vao, vbo_id, len(vertices))
+        return vao, len(vertices)
+
+    @staticmethod
+    def __read_pixels_into(image: np.ndarray, pixel_format: int, pixel_type: int) -> None:
+        """
+        Read the contents of the active frame buffer directly into an existing image.
+
+        .. note::
+            Reading straight into the image avoids PyOpenGL allocating an intermediate bytes object for the pixels.
+            The rows are tightly packed, so images whose rows aren't a multiple of 4 bytes long are read correctly.
+        .. note::
+            The image is filled bottom-up, as per OpenGL's conventions.
+
+        :param image:           The image (a C-contiguous array whose dimensions match the frame buffer).
+        :param pixel_format:    The format of the pixel data to read (e.g. GL_BGR).
+        :param pixel_type:      The type of the pixel data to read (e.g. GL_UNSIGNED_BYTE).
+        """
+        glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        raw_glReadPixels(
+            0, 0, image.shape[1], image.shape[0], pixel_format, pixel_type, image.ctypes.data_as(ctypes.c_void_p)
+        )
+        glPopClientAttrib()
+
+    @staticmethod
+    def __to_column_major(m: np.ndarray) -> np.ndarray:
+        """
+        Copy a 4x4 matrix into a reusable scratch buffer in the column-major, single-precision form OpenGL expects.
+
+        .. note::
+            The buffer is overwritten by the next call on the same thread, so it should be used immediately.
+
+        :param m:   The matrix.
+        :return:    The scratch buffer, containing the elements of the matrix in column-major order.
+        """
+        scratch = getattr(OpenGLUtil.__thread_local, "matrix", None)  # type: Optional[np.ndarray]
+        if scratch is None:
+            scratch = OpenGLUtil.__thread_local.matrix = np.empty(16, dtype=np.float32)
+
+        np.copyto(scratch.reshape((4, 4)), m.T)
+        return scratch
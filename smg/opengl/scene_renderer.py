@@ -1,3 +1,4 @@
+import ctypes
 import numpy as np
 
 from OpenGL.GL import *
@@ -19,11 +20,95 @@ Scene = TypeVar('Scene')
 class SceneRenderer(Generic[Scene]):
     """A simple 3D scene renderer (can be used to render to either the screen or an RGB-D image)."""
 
+    # NESTED TYPES
+
+    class PendingRGBDImage:
+        """An RGB-D image that has been rendered, but whose readback from the GPU may still be in progress."""
+
+        # CONSTRUCTOR
+
+        def __init__(self, colour_pbo: int, depth_pbo: int, width: int, height: int,
+                     slot_generations: List[int], slot_idx: int):
+            """
+            Construct a pending RGB-D image.
+
+            .. note::
+                The renderer bumps the generation of a slot in its ring whenever the slot's pixel buffer objects
+                are reused or reallocated. By checking that the generation of its slot is still the one it was
+                issued with, the pending image can tell whether its pixel buffer objects still hold its contents.
+
+            :param colour_pbo:          The pixel buffer object into which the colour image is being read.
+            :param depth_pbo:           The pixel buffer object into which the depth image is being read.
+            :param width:               The image width.
+            :param height:              The image height.
+            :param slot_generations:    The renderer's (live) list of the current generations of its ring slots.
+            :param slot_idx:            The index of the ring slot whose pixel buffer objects are being used.
+            """
+            self.__colour_pbo: int = colour_pbo
+            self.__depth_pbo: int = depth_pbo
+            self.__generation: int = slot_generations[slot_idx]
+            self.__height: int = height
+            self.__result: Optional[Tuple[np.ndarray, np.ndarray]] = None
+            self.__slot_generations: List[int] = slot_generations
+            self.__slot_idx: int = slot_idx
+            self.__width: int = width
+
+        # PUBLIC METHODS
+
+        def get(self) -> Tuple[np.ndarray, np.ndarray]:
+            """
+            Get the RGB-D image, waiting for its readback from the GPU to finish if necessary.
+
+            :return:                The RGB-D image, as a (colour image, depth image) pair.
+            :raises RuntimeError:   If the image wasn't retrieved before its pixel buffer objects were reused or
+                                    reallocated by the renderer.
+            """
+            if self.__result is None:
+                if self.__slot_generations[self.__slot_idx] != self.__generation:
+                    raise RuntimeError(
+                        "Error: The RGB-D image can no longer be retrieved, since its pixel buffer objects have been "
+                        "reused or reallocated"
+                    )
+
+                width, height = self.__width, self.__height
+                # Note: The colour image is made contiguous (as in OpenGLUtil.read_bgr_image), since the vertical
+                #       flip would otherwise leave it as a view with negative strides.
+                colour_image: np.ndarray = np.ascontiguousarray(OpenGLUtil.read_buffer(
+                    GL_PIXEL_PACK_BUFFER, self.__colour_pbo, width * height * 3
+                ).reshape((height, width, 3))[::-1, :])
+                depth_image: np.ndarray = OpenGLUtil.read_buffer(
+                    GL_PIXEL_PACK_BUFFER, self.__depth_pbo, width * height * 4
+                ).view(np.float32).reshape((height, width))[::-1, :]
+                self.__result = colour_image, OpenGLUtil.linearise_depth_image(depth_image)
+
+            return self.__result
+
+    # CONSTANTS
+
+    # The number of frames of readback that can be in flight at once when rendering RGB-D images asynchronously.
+    ASYNC_RING_SIZE: int = 3
+
+    # The directions from which to light the scene if none are explicitly specified.
+    __DEFAULT_LIGHT_DIRS: List[np.ndarray] = [
+        np.array([0.0, -2.0, -1.0, 0.0], dtype=np.float32),
+        np.array([0.0, 2.0, 1.0, 0.0], dtype=np.float32)
+    ]
+
+    # The diffuse and specular colour of each light.
+    __WHITE: np.ndarray = np.array([1.0, 1.0, 1.0, 1.0], dtype=np.float32)
+
     # CONSTRUCTOR
 
     def __init__(self):
         """Construct a scene renderer."""
+        self.__async_idx: int = 0
+        self.__async_image_size: Optional[Tuple[int, int]] = None
         self.__framebuffer: Optional[OpenGLFrameBuffer] = None
+        self.__gpu_render_time: Optional[float] = None
+        self.__pbo_ids: Optional[List[int]] = None
+        self.__query_ids: Optional[List[int]] = None
+        self.__query_issued: List[bool] = []
+        self.__slot_generations: List[int] = [0] * SceneRenderer.ASYNC_RING_SIZE
 
     # DESTRUCTOR
 
@@ -41,6 +126,22 @@ class SceneRenderer(Generic[Scene]):
         """Destroy the renderer at the end of the with statement that's used to manage its lifetime."""
         self.terminate()
 
+    # PROPERTIES
+
+    @property
+    def gpu_render_time(self) -> Optional[float]:
+        """
+        Get the time (in seconds) that the GPU took to render the most recent asynchronously rendered RGB-D image
+        for which timing information is available.
+
+        .. note::
+            Timing information only becomes available a few frames after an image is rendered, since waiting for
+            it any sooner would stall the CPU. If no timing information is available yet, this will be None.
+
+        :return:    The time that the GPU took to render the image, if available, or None otherwise.
+        """
+        return self.__gpu_render_time
+
     # PUBLIC STATIC METHODS
 
     @staticmethod
@@ -58,26 +159,34 @@ class SceneRenderer(Generic[Scene]):
         """
         # If the light directions haven't been explicitly specified, use the defaults.
         if light_dirs is None:
-            pos: np.ndarray = np.array([0.0, -2.0, -1.0, 0.0])
-            light_dirs = [pos, -pos]
+            light_dirs = SceneRenderer.__DEFAULT_LIGHT_DIRS
 
         # Conversely, if too many light directions have been specified, raise an exception.
         elif len(light_dirs) > 8:
             raise RuntimeError("At most 8 light directions can be specified")
 
-        # Save various attributes so that they can be restored later.
-        glPushAttrib(GL_DEPTH_BUFFER_BIT | GL_ENABLE_BIT | GL_LIGHTING_BIT)
+        # Save the attributes we're about to change so that they can be restored later. Note that we save all of the
+        # enable bits (GL_ENABLE_BIT), so that anything enabled by render_scene is also restored, but only save the
+        # polygon attributes (which include the back-face culling state) if we're actually going to change them.
+        mask: int = GL_DEPTH_BUFFER_BIT | GL_ENABLE_BIT | GL_LIGHTING_BIT
+        if use_backface_culling:
+            mask |= GL_POLYGON_BIT
+
+        glPushAttrib(mask)
 
         # Enable lighting.
         glEnable(GL_LIGHTING)
 
-        # Set up the directional lights.
+        # Set up the directional lights. (Note that the GL functions are bound to local names for the loop, to
+        # avoid looking them up in the module's globals on every iteration.)
+        white: np.ndarray = SceneRenderer.__WHITE
+        gl_enable, gl_lightfv = glEnable, glLightfv
         for i in range(len(light_dirs)):
             light_idx: int = GL_LIGHT0 + i
-            glEnable(light_idx)
-            glLightfv(light_idx, GL_DIFFUSE, np.array([1, 1, 1, 1]))
-            glLightfv(light_idx, GL_SPECULAR, np.array([1, 1, 1, 1]))
-            glLightfv(light_idx, GL_POSITION, light_dirs[i])
+            gl_enable(light_idx)
+            gl_lightfv(light_idx, GL_DIFFUSE, white)
+            gl_lightfv(light_idx, GL_SPECULAR, white)
+            gl_lightfv(light_idx, GL_POSITION, np.asarray(light_dirs[i], dtype=np.float32))
 
         # Enable colour-based materials (i.e. let material properties be defined by glColor).
         glEnable(GL_COLOR_MATERIAL)
@@ -117,13 +226,127 @@ class SceneRenderer(Generic[Scene]):
         :param use_backface_culling:    Whether or not to use back-face culling.
         :return:                        The rendered RGB-D image, as a (colour image, depth image) pair.
         """
+        width, height = image_size
+        framebuffer: OpenGLFrameBuffer = self.render_to_framebuffer(
+            render_scene, world_from_camera, image_size, intrinsics,
+            light_dirs=light_dirs, use_backface_culling=use_backface_culling
+        )
+
+        # Read the contents of the frame buffer and depth buffer into images and return them.
+        with framebuffer:
+            colour_image: np.ndarray = OpenGLUtil.read_bgr_image(width, height)
+            depth_image: np.ndarray = OpenGLUtil.read_depth_image(width, height)
+            return colour_image, depth_image
+
+    def render_rgbd_image_async(self, render_scene: Callable[[], None], world_from_camera: np.ndarray,
+                                image_size: Tuple[int, int], intrinsics: Tuple[float, float, float, float], *,
+                                light_dirs: Optional[List[np.ndarray]] = None, use_backface_culling: bool = False) \
+            -> "SceneRenderer.PendingRGBDImage":
+        """
+        Render the scene to an RGB-D image, without waiting for the image to be read back from the GPU.
+
+        .. note::
+            The image is read back via pixel buffer objects, which lets the GPU transfer it asynchronously whilst
+            the caller gets on with other work (e.g. submitting the next frame). Calling get on the returned object
+            retrieves the image, and only blocks if the transfer hasn't finished yet.
+        .. note::
+            The renderer cycles through a ring of ASYNC_RING_SIZE sets of pixel buffer objects, so the image must be
+            retrieved before this method has been called another ASYNC_RING_SIZE times. Changing the image size
+            reallocates all of the pixel buffer objects, so the image must also be retrieved before this method is
+            called with a different image size (or the renderer is terminated). If it isn't, get will raise an error.
+        .. note::
+            If light_dirs is None, default light directions will be used. For no lights at all, pass in [].
+
+        :param render_scene:            A function that can be called to render the scene itself.
+        :param world_from_camera:       The pose from which to render the scene.
+        :param image_size:              The size of image to render, as a (width, height) tuple.
+        :param intrinsics:              The camera intrinsics, as an (fx, fy, cx, cy) tuple.
+        :param light_dirs:              The directions from which to light the scene (optional).
+        :param use_backface_culling:    Whether or not to use back-face culling.
+        :return:                        The pending RGB-D image.
+        """
+        width, height = image_size
+
+        # Make sure the pixel buffer objects and timer queries in the ring have been allocated.
+        if self.__pbo_ids is None:
+            self.__pbo_ids = [int(i) for i in np.atleast_1d(glGenBuffers(2 * SceneRenderer.ASYNC_RING_SIZE))]
+            self.__query_ids = [int(i) for i in np.atleast_1d(glGenQueries(SceneRenderer.ASYNC_RING_SIZE))]
+            self.__query_issued = [False] * SceneRenderer.ASYNC_RING_SIZE
+
+        # If the image size has changed, resize the pixel buffer objects. This invalidates any pending images that
+        # are still using them, so we bump the generations of all of the slots in the ring.
+        if image_size != self.__async_image_size:
+            for i, pbo_id in enumerate(self.__pbo_ids):
+                glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo_id)
+                glBufferData(GL_PIXEL_PACK_BUFFER, width * height * (3 if i % 2 == 0 else 4), None, GL_STREAM_READ)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            self.__async_image_size = image_size
+            self.__invalidate_async_slots()
+
+        # Pick the next slot in the ring, bumping its generation to invalidate any pending image still using it.
+        idx: int = self.__async_idx
+        self.__async_idx = (idx + 1) % SceneRenderer.ASYNC_RING_SIZE
+        self.__slot_generations[idx] += 1
+        colour_pbo, depth_pbo = self.__pbo_ids[2 * idx], self.__pbo_ids[2 * idx + 1]
+        query_id: int = self.__query_ids[idx]
+
+        # If the timer query in this slot was issued a full ring ago and its result is now available, harvest it.
+        # (If it isn't yet available, we simply skip it rather than stalling to wait for it.)
+        if self.__query_issued[idx] and glGetQueryObjectiv(query_id, GL_QUERY_RESULT_AVAILABLE):
+            self.__gpu_render_time = glGetQueryObjectui64v(query_id, GL_QUERY_RESULT) / 1e9
+
+        # Render the scene, timing how long the GPU takes to do so.
+        glBeginQuery(GL_TIME_ELAPSED, query_id)
+        framebuffer: OpenGLFrameBuffer = self.render_to_framebuffer(
+            render_scene, world_from_camera, image_size, intrinsics,
+            light_dirs=light_dirs, use_backface_culling=use_backface_culling
+        )
+        glEndQuery(GL_TIME_ELAPSED)
+        self.__query_issued[idx] = True
+
+        # Start reading the contents of the frame buffer and depth buffer into the pixel buffer objects.
+        with framebuffer:
+            glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+            glPixelStorei(GL_PACK_ALIGNMENT, 1)
+
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, colour_pbo)
+            glReadPixels(0, 0, width, height, GL_BGR, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, depth_pbo)
+            glReadPixels(0, 0, width, height, GL_DEPTH_COMPONENT, GL_FLOAT, ctypes.c_void_p(0))
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+            glPopClientAttrib()
+
+        return SceneRenderer.PendingRGBDImage(colour_pbo, depth_pbo, width, height, self.__slot_generations, idx)
+
+    def render_to_framebuffer(self, render_scene: Callable[[], None], world_from_camera: np.ndarray,
+                              image_size: Tuple[int, int], intrinsics: Tuple[float, float, float, float], *,
+                              light_dirs: Optional[List[np.ndarray]] = None, use_backface_culling: bool = False) \
+            -> OpenGLFrameBuffer:
+        """
+        Render the scene to the renderer's off-screen frame buffer, without reading the result back from the GPU.
+
+        .. note::
+            This is useful when the result is going to be consumed on the GPU anyway (e.g. by a later rendering
+            pass, or by CUDA via the frame buffer's colour buffer texture), since it avoids copying the image to
+            the CPU and back again. The frame buffer is owned by the renderer, and is reused by subsequent renders.
+        .. note::
+            If light_dirs is None, default light directions will be used. For no lights at all, pass in [].
+
+        :param render_scene:            A function that can be called to render the scene itself.
+        :param world_from_camera:       The pose from which to render the scene.
+        :param image_size:              The size of image to render, as a (width, height) tuple.
+        :param intrinsics:              The camera intrinsics, as an (fx, fy, cx, cy) tuple.
+        :param light_dirs:              The directions from which to light the scene (optional).
+        :param use_backface_culling:    Whether or not to use back-face culling.
+        :return:                        The frame buffer to which the scene has been rendered.
+        """
         # Make sure the OpenGL frame buffer has been constructed and has the right size.
         width, height = image_size
         if self.__framebuffer is None:
-            self.__framebuffer = OpenGLFrameBuffer(width, height)
-        elif width != self.__framebuffer.width or height != self.__framebuffer.height:
-            self.__framebuffer.terminate()
-            self.__framebuffer = OpenGLFrameBuffer(width, height)
+            self.__framebuffer = OpenGLFrameBuffer(width, height, bind_on_construct=True)
+        else:
+            self.__framebuffer.resize(width, height)
 
         with self.__framebuffer:
             # Set the viewport to encompass the whole frame buffer.
@@ -144,13 +367,33 @@ class SceneRenderer(Generic[Scene]):
                     # Render the scene itself with the specified lighting.
                     SceneRenderer.render(render_scene, light_dirs=light_dirs, use_backface_culling=use_backface_culling)
 
-                    # Read the contents of the frame buffer and depth buffer into images and return them.
-                    colour_image: np.ndarray = OpenGLUtil.read_bgr_image(width, height)
-                    depth_image: np.ndarray = OpenGLUtil.read_depth_image(width, height)
-                    return colour_image, depth_image
+        return self.__framebuffer
 
     def terminate(self) -> None:
         """Destroy the renderer."""
         if self.__framebuffer is not None:
             self.__framebuffer.terminate()
             self.__framebuffer = None
+
+        if self.__pbo_ids is not None:
+            try:
+                glDeleteBuffers(len(self.__pbo_ids), self.__pbo_ids)
+                glDeleteQueries(len(self.__query_ids), self.__query_ids)
+            except Error:
+                # Note: Failing to delete the buffers and queries is fairly harmless, whereas crashing isn't.
+                pass
+
+            self.__pbo_ids = None
+            self.__query_ids = None
+            self.__async_image_size = None
+            self.__invalidate_async_slots()
+
+    # PRIVATE METHODS
+
+    def __invalidate_async_slots(self) -> None:
+        """
+        Bump the generations of all of the slots in the ring of pixel buffer objects used for asynchronous rendering,
+        so that any pending RGB-D images that are still using them can no longer be retrieved.
+        """
+        for i in range(len(self.__slot_generations)):
+            self.__slot_generations[i] += 1
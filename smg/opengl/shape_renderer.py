@@ -1,27 +1,92 @@
+import numpy as np
+
+from typing import List
+
 from smg.utility import Cylinder, ShapeVisitor, Sphere
 
 from .opengl_util import OpenGLUtil
 
 
 class ShapeRenderer(ShapeVisitor):
-    """A geometric shape renderer."""
+    """
+    A geometric shape renderer.
+
+    .. note::
+        By default, each shape is rendered as soon as it's visited. However, if the renderer is used in a with
+        statement, the shapes visited are instead collected and rendered together, grouped by type, when the with
+        statement ends (or when flush is called). The spheres are rendered using a single draw call, and the
+        cylinders with the relevant OpenGL state set only once, which is much cheaper when there are lots of
+        shapes. Any OpenGL state that affects how the shapes look (e.g. the current colour) must then be set
+        before they're flushed, rather than between visits.
+    .. note::
+        Batching also changes the order in which things are drawn: all of the spheres are drawn before all of the
+        cylinders, and all of the shapes are drawn after anything else that's rendered within the with statement
+        before the flush. With depth testing and opaque shapes, this makes no difference to the result. However,
+        if the shapes are blended (e.g. translucent), or depth testing is disabled, it can change what's visible.
+        In that case, either call flush before rendering anything that must be drawn after the shapes visited so
+        far, or don't batch the shapes.
+    """
+
+    # CONSTRUCTOR
+
+    def __init__(self):
+        """Construct a shape renderer."""
+        self.__batching = False     # type: bool
+        self.__cylinders = []       # type: List[Cylinder]
+        self.__sphere_centres = []  # type: List[np.ndarray]
+        self.__sphere_radii = []    # type: List[float]
+
+    # SPECIAL METHODS
+
+    def __enter__(self):
+        """Start collecting the shapes that are visited, so that they can later be rendered together."""
+        self.__batching = True
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        """Render any shapes that have been collected, and go back to rendering each shape as it's visited."""
+        self.flush()
+        self.__batching = False
 
     # PUBLIC METHODS
 
+    def flush(self) -> None:
+        """Render any shapes that have been collected since the last flush."""
+        if len(self.__sphere_centres) > 0:
+            OpenGLUtil.render_spheres(
+                np.array(self.__sphere_centres), np.array(self.__sphere_radii), slices=10, stacks=10
+            )
+            self.__sphere_centres.clear()
+            self.__sphere_radii.clear()
+
+        if len(self.__cylinders) > 0:
+            OpenGLUtil.render_cylinders(
+                [c.base_centre for c in self.__cylinders], [c.top_centre for c in self.__cylinders],
+                [c.base_radius for c in self.__cylinders], [c.top_radius for c in self.__cylinders], slices=10
+            )
+            self.__cylinders.clear()
+
     def visit_cylinder(self, cylinder: Cylinder) -> None:
         """
-        Render a cylinder.
+        Render a cylinder (or, if shapes are being collected, add it to the cylinders to be rendered later).
 
         :param cylinder:    The cylinder.
         """
-        OpenGLUtil.render_cylinder(
-            cylinder.base_centre, cylinder.top_centre, cylinder.base_radius, cylinder.top_radius, slices=10
-        )
+        if self.__batching:
+            self.__cylinders.append(cylinder)
+        else:
+            OpenGLUtil.render_cylinder(
+                cylinder.base_centre, cylinder.top_centre, cylinder.base_radius, cylinder.top_radius, slices=10
+            )
 
     def visit_sphere(self, sphere: Sphere) -> None:
         """
-        Render a sphere.
+        Render a sphere (or, if shapes are being collected, add it to the spheres to be rendered later).
 
         :param sphere:  The sphere.
         """
-        OpenGLUtil.render_sphere(sphere.centre, sphere.radius, slices=10, stacks=10)
+        if self.__batching:
+            self.__sphere_centres.append(sphere.centre)
+            self.__sphere_radii.append(sphere.radius)
+        else:
+            OpenGLUtil.render_sphere(sphere.centre, sphere.radius, slices=10, stacks=10)